@@ -2,32 +2,226 @@
 import os
 import json
 import yaml
-import traceback
+import logging
+import logging.handlers
+import atexit
+import queue
 import re
-from flask import Flask, request, jsonify, render_template
+import hashlib
+import importlib
+import secrets
+import threading
+import time
+import zlib
+from functools import lru_cache
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 from smolagents import CodeAgent, OpenAIServerModel, tool
-from datetime import datetime
-from math import radians, sin, cos, sqrt, atan2
+from smolagents.memory import ActionStep, FinalAnswerStep
+from datetime import datetime, date
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple
+from decimal import Decimal
+from contextvars import ContextVar
+from contextlib import contextmanager
+from tools.result_cache import TTLCache, ResultCache, open_disk_cache
+from tools.pdok_http import warm_connections
+from tools.spatial_kernels import (
+    rings_centroid_area, round_coordinates, prepare_polygons, location_checks,
+    build_feature_columns, summarize_feature_columns, mean_location, era_counts, ERA_LABELS
+)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import httpx
+    from openai import DefaultHttpxClient
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 load_dotenv()
 
+# Per-feature detail is logged at DEBUG; set LOG_LEVEL=DEBUG to see it.
+# Request threads only put records on a queue; formatting and the write to
+# stderr happen on the listener's thread, so logging never blocks a query.
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+_log_listener = logging.handlers.QueueListener(queue.SimpleQueue(), _log_handler, respect_handler_level=True)
+_queue_handler = logging.handlers.QueueHandler(_log_listener.queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))  # the listener's handler adds the prefix
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), handlers=[_queue_handler])
+_log_listener.start()
+atexit.register(_log_listener.stop)
+log = logging.getLogger(__name__)
+
+# gzip responses (GeoJSON compresses ~3x) when Flask-Compress is installed.
+# It would buffer streamed responses to compress them, so those are left to
+# _streamed_json_response, which gzips chunk by chunk.
+# Level 1 gets most of the size win on JSON at a fraction of the CPU, and
+# bodies under 4 KB are not worth compressing.
+app.config['COMPRESS_STREAMS'] = False
+app.config['COMPRESS_LEVEL'] = 1
+app.config['COMPRESS_BR_LEVEL'] = 4
+app.config['COMPRESS_MIN_SIZE'] = 4096
+try:
+    from flask_compress import Compress
+    Compress(app)
+except ImportError:
+    pass
+
+# The model's OpenAI client is shared by every agent, so its connection pool
+# is too. Connections are kept alive long enough to span the tool calls
+# between an agent's LLM steps, and a dead endpoint fails in seconds rather
+# than the client's default ten minutes.
+OPENAI_CONNECT_TIMEOUT = 5.0
+OPENAI_READ_TIMEOUT = 60.0
+OPENAI_MAX_RETRIES = 3
+OPENAI_KEEPALIVE_SECONDS = 60.0
+
+def openai_client_kwargs() -> dict:
+    kwargs = {"max_retries": OPENAI_MAX_RETRIES}
+    if HTTPX_AVAILABLE:
+        timeout = httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+        kwargs["timeout"] = timeout
+        kwargs["http_client"] = DefaultHttpxClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16,
+                                keepalive_expiry=OPENAI_KEEPALIVE_SECONDS)
+        )
+    else:
+        kwargs["timeout"] = OPENAI_READ_TIMEOUT
+    return kwargs
+
 # Initialize OpenAI model
 model = OpenAIServerModel(
     model_id="gpt-4o-mini",
     api_base="https://api.openai.com/v1",
     api_key=os.getenv('OPENAI_API_KEY'),
     max_completion_tokens=3072,
+    client_kwargs=openai_client_kwargs(),
 )
 
-# Global state
-current_map_state = {
-    "features": [],
-    "search_location": None,
-    "layer_type": None,
-    "last_query": None
-}
+# Timestamps are advisory, so one ISO string (to the second) is reused
+# until the clock moves on instead of formatting a datetime per call
+_now_iso_cache = (0, "")
+
+def now_iso() -> str:
+    """Local time as an ISO 8601 string, to the second."""
+    global _now_iso_cache
+    second = int(time.time())
+    if _now_iso_cache[0] != second:
+        _now_iso_cache = (second, datetime.fromtimestamp(second).isoformat())
+    return _now_iso_cache[1]
+
+@dataclass(frozen=True, slots=True)
+class MapState:
+    """Immutable snapshot of what the map shows; "columns" is the analytics view of "features"."""
+    features: tuple = ()
+    columns: Optional[dict] = None
+    search_location: Optional[dict] = None
+    layer_type: Optional[str] = None
+    last_query: Optional[str] = None
+    last_updated: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """JSON view of the state, without the analytics columns."""
+        return {
+            "features": self.features,
+            "search_location": self.search_location,
+            "layer_type": self.layer_type,
+            "last_query": self.last_query,
+            "last_updated": self.last_updated
+        }
+
+EMPTY_MAP_STATE = MapState()
+
+# One map per browser session, keyed by the MAP_SESSION_COOKIE id. Each
+# request binds its session id to a ContextVar, so tools running in the
+# request's thread see that user's map and never another's.
+MAP_SESSION_COOKIE = 'map_session'
+MAP_SESSION_TTL = 24 * 3600
+MAP_SESSION_MAX = 1024
+DEFAULT_MAP_SESSION = 'default'
+_map_states = TTLCache(maxsize=MAP_SESSION_MAX, ttl=MAP_SESSION_TTL)
+_map_session_id: ContextVar[str] = ContextVar('map_session_id', default=DEFAULT_MAP_SESSION)
+_map_state_lock = threading.Lock()
+
+def current_map_state() -> MapState:
+    """Snapshot of the map for the session bound to this request."""
+    return _map_states.get(_map_session_id.get(), EMPTY_MAP_STATE)
+
+def update_map_state(reset: bool = False, **changes) -> MapState:
+    """Atomically derive the session's next snapshot from its current one (or a blank one) and publish it."""
+    session_id = _map_session_id.get()
+    with _map_state_lock:
+        state = EMPTY_MAP_STATE if reset else _map_states.get(session_id, EMPTY_MAP_STATE)
+        state = replace(state, **changes)
+        _map_states.set(session_id, state)
+        return state
+
+@app.before_request
+def bind_map_session():
+    """Bind the request to its map session, issuing a new session id when the cookie is missing."""
+    session_id = request.cookies.get(MAP_SESSION_COOKIE, '')
+    if not 0 < len(session_id) <= 64:
+        session_id = secrets.token_urlsafe(16)
+        g.new_map_session = session_id
+    _map_session_id.set(session_id)
+
+@app.after_request
+def set_map_session_cookie(response):
+    session_id = g.pop('new_map_session', None)
+    if session_id:
+        response.set_cookie(MAP_SESSION_COOKIE, session_id, max_age=MAP_SESSION_TTL,
+                            httponly=True, samesite='Lax')
+    return response
+
+# Agent result cache: repeated prompts skip the LLM round-trips for an hour,
+# across restarts and gunicorn workers when RESULT_CACHE_DIR is set
+AGENT_CACHE_TTL = 3600
+AGENT_CACHE_MAX_ENTRIES = 128
+agent_result_cache = ResultCache(
+    maxsize=AGENT_CACHE_MAX_ENTRIES, ttl=AGENT_CACHE_TTL,
+    disk=open_disk_cache("agent_results", AGENT_CACHE_TTL)
+)
+# Encoded geojson_data bytes of recent cached answers, keyed like
+# agent_result_cache, so a repeated query reuses the serialized features
+ENCODED_FEATURES_CACHE_TTL = 600
+encoded_features_cache = TTLCache(maxsize=64, ttl=ENCODED_FEATURES_CACHE_TTL)
+# Bumped whenever the agent reads the map; such answers depend on state and are not cached
+_map_analysis_calls = 0
+_map_analysis_lock = threading.Lock()
+
+# libyaml's C loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# yaml path -> (mtime, parsed templates); re-parsed only when the file changes
+_prompt_template_cache = {}
+
+def _read_prompt_yaml(yaml_path):
+    """
+    Parse a prompt YAML file, reusing the previous parse while the file is
+    unchanged. Size and inode are compared too, so an edit within the same
+    mtime tick or a file swapped in by rename is still picked up.
+    """
+    st = os.stat(yaml_path)
+    signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _prompt_template_cache.get(yaml_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    log.debug("📂 Loading: %s", yaml_path)
+    with open(yaml_path, 'r', encoding='utf-8') as stream:
+        prompt_templates = yaml.load(stream, Loader=YAML_LOADER)
+    _prompt_template_cache[yaml_path] = (signature, prompt_templates)
+    return prompt_templates
 
 def load_prompt_templates():
     """Load prompt templates using smolagents pattern."""
@@ -41,24 +235,21 @@ def load_prompt_templates():
     for yaml_path in yaml_paths:
         try:
             if os.path.exists(yaml_path):
-                print(f"📂 Loading: {yaml_path}")
-                with open(yaml_path, 'r', encoding='utf-8') as stream:
-                    prompt_templates = yaml.safe_load(stream)
+                prompt_templates = _read_prompt_yaml(yaml_path)
                 if prompt_templates and isinstance(prompt_templates, dict):
-                    print(f"✅ Loaded prompt templates from {yaml_path}")
-                    print(f"📋 Sections: {list(prompt_templates.keys())}")
+                    log.debug("✅ Loaded prompt templates from %s", yaml_path)
+                    log.debug("📋 Sections: %s", list(prompt_templates.keys()))
                     return prompt_templates
-                print(f"⚠️ Invalid YAML structure in {yaml_path}")
+                log.warning("⚠️ Invalid YAML structure in %s", yaml_path)
         except Exception as e:
-            print(f"❌ Error loading {yaml_path}: {e}")
+            log.error("❌ Error loading %s: %s", yaml_path, e)
     
-    print("⚠️ No valid YAML found, using fallback")
+    log.warning("⚠️ No valid YAML found, using fallback")
     return get_fallback_prompt_templates()
 
-def get_fallback_prompt_templates():
-    """Fallback prompt templates for smolagents."""
-    return {
-        "system_prompt": """You are an expert PDOK spatial analysis assistant for Dutch geospatial data.
+# Used when no prompt YAML can be read; built once and shared read-only
+FALLBACK_PROMPT_TEMPLATES = {
+    "system_prompt": """You are an expert PDOK spatial analysis assistant for Dutch geospatial data.
 
 CRITICAL TOOL USAGE:
 ```python
@@ -103,34 +294,45 @@ SERVICE MAPPING:
 - Parcels → "cadastral"
 - Nature → "natura2000"
 """,
-        "planning": {
-            "initial_plan": "1. Find location 2. Discover PDOK service 3. Fetch data 4. Format response",
-            "update_plan_pre_messages": "Review results and adjust",
-            "update_plan_post_messages": "End with final_answer"
-        },
-        "managed_agent": {
-            "task": "{{task}}",
-            "report": "{{final_answer}}"
-        },
-        "final_answer": {
-            "pre_messages": "Use final_answer with JSON",
-            "post_messages": "Required: final_answer(json.dumps({\"text_description\": \"...\", \"geojson_data\": [...], \"search_location\": {...}, \"layer_type\": \"...\"}))"
-        }
+    "planning": {
+        "initial_plan": "1. Find location 2. Discover PDOK service 3. Fetch data 4. Format response",
+        "update_plan_pre_messages": "Review results and adjust",
+        "update_plan_post_messages": "End with final_answer"
+    },
+    "managed_agent": {
+        "task": "{{task}}",
+        "report": "{{final_answer}}"
+    },
+    "final_answer": {
+        "pre_messages": "Use final_answer with JSON",
+        "post_messages": "Required: final_answer(json.dumps({\"text_description\": \"...\", \"geojson_data\": [...], \"search_location\": {...}, \"layer_type\": \"...\"}))"
     }
+}
+
+def get_fallback_prompt_templates():
+    """Fallback prompt templates for smolagents."""
+    return FALLBACK_PROMPT_TEMPLATES
 
 @tool
 def analyze_current_map_features() -> dict:
-    """Analyze current map features."""
-    global current_map_state
-    features = current_map_state.get("features", [])
+    """Analyze current map features: geometry types, construction years, areas and extent."""
+    global _map_analysis_calls
+    with _map_analysis_lock:
+        _map_analysis_calls += 1
+    state = current_map_state()
+    features = state.features
+    if not features:
+        return {"message": "No features displayed", "feature_count": 0}
+    columns = state.columns or build_feature_columns(features)
     return {
         "feature_count": len(features),
-        "layer_type": current_map_state.get("layer_type", "unknown"),
-        "summary": f"Displaying {len(features)} features"
-    } if features else {"message": "No features displayed", "feature_count": 0}
+        "layer_type": state.layer_type or "unknown",
+        "summary": f"Displaying {len(features)} features",
+        **summarize_feature_columns(columns)
+    }
 
-def create_intelligent_agent():
-    """Create agent with smolagents pattern."""
+def create_agent_tools():
+    """Instantiate the agent's tools; returns (tools, tools_available)."""
     try:
         from tools.enhanced_pdok_location_tool import IntelligentLocationSearchTool
         from tools.enhanced_discovery_tool import IntentDrivenPDOKDiscoveryTool
@@ -141,96 +343,209 @@ def create_intelligent_agent():
             FlexibleSpatialDataTool(),
             analyze_current_map_features
         ]
-        print("✅ Tools loaded")
-        tools_available = True
+        log.info("✅ Tools loaded")
+        return tools, True
     except ImportError as e:
-        print(f"❌ Tool import error: {e}")
-        tools = [analyze_current_map_features]
-        tools_available = False
+        log.error("❌ Tool import error: %s", e)
+        return [analyze_current_map_features], False
+
+# The tools keep no per-call state and pyproj (3.1+) Transformers are
+# thread-safe, so one set is built per process and shared by every agent
+agent_tools, tools_available = create_agent_tools()
+
+# CodeAgent settings, the same for every thread's agent
+AGENT_SETTINGS = {
+    "max_steps": 8,
+    "verbosity_level": 1,
+    "grammar": None,
+    "planning_interval": None,
+    "name": None,
+    "description": None,
+    # Token streaming is switched on per run by query_stream(); left on, every
+    # plain /api/query run would redraw each token on the console
+    "stream_outputs": False
+}
+AGENT_AUTHORIZED_IMPORTS = ("json", "re", "geopy", "math")
+
+def preload_authorized_imports():
+    """
+    Import the modules agent code may import, once at startup, so an
+    `import geopy` inside the first queries is a sys.modules lookup.
+    """
+    for name in AGENT_AUTHORIZED_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            log.warning("⚠️ Authorized import '%s' is not installed", name)
+
+preload_authorized_imports()
+
+class PdokCodeAgent(CodeAgent):
+    """
+    CodeAgent that renders its system prompt once. smolagents re-renders the
+    Jinja template with every tool description at the start of each run,
+    although the templates, tools and imports never change after creation.
+    """
     
-    print(f"🧠 Creating agent with {len(tools)} tools")
+    def initialize_system_prompt(self) -> str:
+        rendered = getattr(self, '_rendered_system_prompt', None)
+        if rendered is None:
+            rendered = self._rendered_system_prompt = super().initialize_system_prompt()
+        return rendered
+
+def create_intelligent_agent():
+    """Create agent with smolagents pattern."""
+    log.info("🧠 Creating agent with %d tools", len(agent_tools))
     prompt_templates = load_prompt_templates()
-    print(f"📋 Prompt sections: {list(prompt_templates.keys())}")
+    log.debug("📋 Prompt sections: %s", list(prompt_templates.keys()))
     
-    agent = CodeAgent(
+    return PdokCodeAgent(
         model=model,
-        tools=tools,
-        max_steps=8,
-        verbosity_level=1,
-        grammar=None,
-        planning_interval=None,
-        name=None,
-        description=None,
+        tools=agent_tools,
         prompt_templates=prompt_templates,
-        additional_authorized_imports=["json", "re", "geopy", "math"]
+        additional_authorized_imports=list(AGENT_AUTHORIZED_IMPORTS),
+        **AGENT_SETTINGS
     )
-    return agent, tools_available
 
-# Initialize agent
-agent, tools_available = create_intelligent_agent()
+# A CodeAgent keeps per-run memory, so every server thread gets its own
+# agent; building one only wraps the shared tools. Nothing is built at
+# import, so the agent and its prompt cost nothing until the first query.
+_agent_local = threading.local()
 
-def safe_json_parse(text: str) -> dict:
-    """Enhanced JSON parsing with fallbacks."""
-    debug_info = {"original_length": len(text), "parsing_attempts": []}
-    
-    # Method 1: Direct JSON
+def get_agent():
+    """The calling thread's agent, created on first use."""
+    thread_agent = getattr(_agent_local, 'agent', None)
+    if thread_agent is None:
+        thread_agent = create_intelligent_agent()
+        _agent_local.agent = thread_agent
+    return thread_agent
+
+def _tool_schema_hash() -> str:
+    """Hash of the agent's tool names, descriptions and inputs; a tool change invalidates the cache."""
+    schema = sorted(
+        (t.name, getattr(t, 'description', ''), json.dumps(getattr(t, 'inputs', {}), sort_keys=True, default=str))
+        for t in agent_tools
+    )
+    return hashlib.sha256(json.dumps(schema).encode('utf-8')).hexdigest()
+
+TOOL_SCHEMA_HASH = _tool_schema_hash()
+
+# Task templates, formatted per request; the map context is only added while features are shown
+MAP_CONTEXT_TEMPLATE = (
+    "{query}\n\n"
+    "Current map context:\n"
+    "- Layer: {layer_type}\n"
+    "- Features on map: {feature_count}\n"
+    "- Search location: {location}\n"
+    "Use analyze_current_map_features() when the question is about what the map already shows."
+)
+LOCATION_TEMPLATE = "{name} ({lat:.4f}°N, {lon:.4f}°E)"
+
+def build_agent_task(query_text: str, state: MapState) -> str:
+    """Agent task for a query: the query itself, plus the map context when features are displayed."""
+    if not state.features:
+        return query_text
+    location = state.search_location or {}
+    if 'lat' in location and 'lon' in location:
+        location_text = LOCATION_TEMPLATE.format(
+            name=location.get('name', 'Search Area'), lat=location['lat'], lon=location['lon']
+        )
+    else:
+        location_text = "unknown"
+    return MAP_CONTEXT_TEMPLATE.format(
+        query=query_text,
+        layer_type=state.layer_type or "unknown",
+        feature_count=len(state.features),
+        location=location_text
+    )
+
+def agent_cache_key(task: str) -> str:
+    """Cache key on (model_id, normalized task, tool schemas)."""
+    normalized = " ".join(task.lower().split())
+    raw = json.dumps([model.model_id, normalized, TOOL_SCHEMA_HASH])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+# Patterns used by safe_json_parse, compiled once at import
+TEXT_DESCRIPTION_RE = re.compile(r'"text_description"\s*:\s*"([^"]*)"')
+GEOJSON_DATA_RE = re.compile(r'"geojson_data"\s*:\s*(?=\[)')
+SEARCH_LOCATION_RE = re.compile(r'"search_location"\s*:\s*(?=\{)')
+LAYER_TYPE_RE = re.compile(r'"layer_type"\s*:\s*"([^"]*)"')
+
+# Keys that mark the agent's final answer object; strict=False accepts the raw
+# newlines LLMs leave inside strings
+RESPONSE_KEYS = ("text_description", "geojson_data")
+# A JSON object with keys opens with '{' then a quote; other braces are skipped
+JSON_OBJECT_START_RE = re.compile(r'\{(?=\s*")')
+_json_decoder = json.JSONDecoder(strict=False)
+
+def find_json_object(text: str, required_keys=RESPONSE_KEYS) -> Optional[dict]:
+    """
+    First JSON object in text that has all required_keys. Each candidate '{'
+    is tried with raw_decode, which parses the balanced object in C and stops
+    at its end, so nested brackets and braces inside strings are handled.
+    """
+    # No candidate can match once a key no longer occurs after it
+    last_start = min(text.rfind(f'"{key}"') for key in required_keys)
+    for match in JSON_OBJECT_START_RE.finditer(text):
+        if match.start() >= last_start:
+            break
+        try:
+            obj, _ = _json_decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        if all(key in obj for key in required_keys):
+            return obj
+    return None
+
+def _decode_at(text: str, index: int):
+    """Decode the JSON value starting at text[index], or None."""
     try:
-        if text.strip().startswith('{') and text.strip().endswith('}'):
-            parsed = json.loads(text.strip())
-            debug_info["parsing_attempts"].append({"method": "direct_json", "success": True})
-            return parsed
-    except json.JSONDecodeError as e:
-        debug_info["parsing_attempts"].append({"method": "direct_json", "success": False, "error": str(e)})
-    
-    # Method 2: Extract from final_answer
+        return _json_decoder.raw_decode(text, index)[0]
+    except json.JSONDecodeError:
+        return None
+
+def safe_json_parse(text: str) -> dict:
+    """Enhanced JSON parsing with fallbacks; returns on the first method that succeeds."""
+    # Method 1: Direct JSON; both decoders skip surrounding whitespace and
+    # reject anything else after the object
     try:
-        match = re.search(r'final_answer\s*\(\s*json\.dumps\s*\(\s*(\{.*?\})\s*\)\s*\)', text, re.DOTALL)
-        if match:
-            json_str = match.group(1).replace('\n', '').replace('  ', ' ')
-            parsed = json.loads(json_str)
-            debug_info["parsing_attempts"].append({"method": "final_answer", "success": True})
-            return parsed
-    except (json.JSONDecodeError, AttributeError) as e:
-        debug_info["parsing_attempts"].append({"method": "final_answer", "success": False, "error": str(e)})
+        parsed = orjson.loads(text) if ORJSON_AVAILABLE else json.loads(text)
+    except ValueError:
+        parsed = None
+    if isinstance(parsed, dict):
+        return parsed
+    
+    # Method 2: The answer object embedded in a transcript or final_answer(...) call
+    found = find_json_object(text)
+    if found is not None:
+        return found
     
     # Method 3: Reconstruct components
-    try:
-        components = {}
-        text_match = re.search(r'"text_description"\s*:\s*"([^"]*)"', text)
-        if text_match:
-            components["text_description"] = text_match.group(1)
-        
-        geojson_match = re.search(r'"geojson_data"\s*:\s*(\[.*?\])', text, re.DOTALL)
-        if geojson_match:
-            try:
-                components["geojson_data"] = json.loads(geojson_match.group(1))
-            except:
-                components["geojson_data"] = []
-        
-        location_match = re.search(r'"search_location"\s*:\s*(\{[^}]*\})', text)
-        if location_match:
-            try:
-                components["search_location"] = json.loads(location_match.group(1))
-            except:
-                components["search_location"] = None
-        
-        layer_match = re.search(r'"layer_type"\s*:\s*"([^"]*)"', text)
-        if layer_match:
-            components["layer_type"] = layer_match.group(1)
-        
-        if components:
-            reconstructed = {
-                "text_description": components.get("text_description", "Analysis completed"),
-                "geojson_data": components.get("geojson_data", []),
-                "search_location": components.get("search_location"),
-                "layer_type": components.get("layer_type", "unknown")
-            }
-            debug_info["parsing_attempts"].append({"method": "reconstruction", "success": True})
-            return reconstructed
-    except Exception as e:
-        debug_info["parsing_attempts"].append({"method": "reconstruction", "success": False, "error": str(e)})
+    components = {}
+    text_match = TEXT_DESCRIPTION_RE.search(text)
+    if text_match:
+        components["text_description"] = text_match.group(1)
+    
+    geojson_match = GEOJSON_DATA_RE.search(text)
+    if geojson_match:
+        components["geojson_data"] = _decode_at(text, geojson_match.end()) or []
+    
+    location_match = SEARCH_LOCATION_RE.search(text)
+    if location_match:
+        components["search_location"] = _decode_at(text, location_match.end())
+    
+    layer_match = LAYER_TYPE_RE.search(text)
+    if layer_match:
+        components["layer_type"] = layer_match.group(1)
+    
+    if components:
+        return {
+            "text_description": components.get("text_description", "Analysis completed"),
+            "geojson_data": components.get("geojson_data", []),
+            "search_location": components.get("search_location"),
+            "layer_type": components.get("layer_type", "unknown")
+        }
     
-    debug_info["parsing_attempts"].append({"method": "fallback", "success": True})
     return {
         "text_description": f"Could not parse response. Raw: {text[:200]}...",
         "geojson_data": [],
@@ -238,72 +553,125 @@ def safe_json_parse(text: str) -> dict:
         "layer_type": "error"
     }
 
+def _sanitize_feature(feature: dict) -> dict:
+    """
+    Make a validated feature's coordinates plain floats. Properties are left
+    as they are: _encode_json serializes NumPy, Decimal and date values itself.
+    """
+    feature['lat'] = float(feature['lat'])
+    feature['lon'] = float(feature['lon'])
+    return feature
+
+# (lat_min, lat_max, lon_min, lon_max) accepted for feature centroids
+NETHERLANDS_BOUNDS = (50.0, 54.0, 3.0, 8.0)
+
+# Fallback feature description: one template per known attribute, in display order
+PARCEL_AREA_TEMPLATE = "Area: {0:.0f} m² ({1:.2f} ha)"
+FEATURE_DESCRIPTION_TEMPLATES = (
+    ('perceelnummer', "Parcel: {0}"),
+    ('bouwjaar', "Built: {0}"),
+    ('oppervlakte', "Area: {0}m²"),
+    ('status', "Status: {0}"),
+    ('bodemgebruik', "Land Use: {0}"),
+)
+
+def _describe_feature(props: dict) -> str:
+    """Join the templates of the attributes a feature has, e.g. 'Built: 1920 | Status: ...'."""
+    parts = []
+    if props.get('kadastraleGrootteWaarde'):
+        area_m2 = float(props['kadastraleGrootteWaarde'])
+        parts.append(PARCEL_AREA_TEMPLATE.format(area_m2, area_m2 / 10000))
+    parts.extend(template.format(props[key]) for key, template in FEATURE_DESCRIPTION_TEMPLATES if props.get(key))
+    return " | ".join(parts) or "PDOK spatial feature"
+
 def validate_and_fix_features(features, search_location=None, radius_km=15):
     """Validate and fix feature data with strict radius filtering."""
     if not isinstance(features, list):
-        print("⚠️ Features is not a list")
+        log.warning("⚠️ Features is not a list")
         return []
     
     valid_features = []
     
+    # Polygons are checked, rounded and measured in one batch up front
+    polygon_indices = [
+        i for i, f in enumerate(features)
+        if isinstance(f, dict) and isinstance(f.get('geometry'), dict)
+        and f['geometry'].get('type') == 'Polygon' and f['geometry'].get('coordinates')
+    ]
+    prepared = prepare_polygons([features[i]['geometry']['coordinates'] for i in polygon_indices])
+    polygon_stats = rings_centroid_area([rings[0] if rings else None for rings in prepared])
+    prepared_polygons = {i: (rings, stats) for i, rings, stats in zip(polygon_indices, prepared, polygon_stats)}
+    
+    # Bounds and radius are then tested for all centroids in one array pass
+    centers = {i: (stats[1], stats[0]) for i, (rings, stats) in prepared_polygons.items() if rings and stats}
+    for i, f in enumerate(features):
+        geometry = f.get('geometry') if isinstance(f, dict) else None
+        if isinstance(geometry, dict) and geometry.get('type') == 'Point' and len(geometry.get('coordinates') or []) >= 2:
+            try:
+                centers[i] = (float(geometry['coordinates'][1]), float(geometry['coordinates'][0]))
+            except (TypeError, ValueError):
+                pass
+    has_center = bool(search_location and 'lat' in search_location and 'lon' in search_location)
+    inside_bounds, distances = location_checks(
+        [c[0] for c in centers.values()], [c[1] for c in centers.values()], NETHERLANDS_BOUNDS,
+        (search_location['lat'], search_location['lon']) if has_center else None
+    )
+    check_index = {i: k for k, i in enumerate(centers)}
+    
     for i, feature in enumerate(features):
         try:
             if not isinstance(feature, dict):
-                print(f"   ⚠️ Feature {i+1}: not a dictionary")
+                log.debug("⚠️ Feature %d: not a dictionary", i + 1)
                 continue
             
             has_geometry = 'geometry' in feature and feature['geometry'] is not None
             if not has_geometry:
-                print(f"   ❌ Feature {i+1}: missing or invalid geometry")
+                log.debug("❌ Feature %d: missing or invalid geometry", i + 1)
                 continue
             
             geometry = feature['geometry']
             lat, lon = None, None
             
             if geometry.get('type') == 'Polygon' and 'coordinates' in geometry:
-                coords = geometry['coordinates'][0]
-                if coords and len(coords) > 0:
-                    lons = [coord[0] for coord in coords if len(coord) >= 2]
-                    lats = [coord[1] for coord in coords if len(coord) >= 2]
-                    if lons and lats:
-                        lon = sum(lons) / len(lons)
-                        lat = sum(lats) / len(lats)
-                        feature['lat'] = lat
-                        feature['lon'] = lon
-                    else:
-                        print(f"   ❌ Feature {i+1}: invalid polygon coordinates")
-                        continue
+                rings, stats = prepared_polygons.get(i, (None, None))
+                if rings and stats:
+                    geometry['coordinates'] = rings
+                    lon, lat, _ = stats
+                    feature['lat'] = lat
+                    feature['lon'] = lon
+                else:
+                    log.debug("❌ Feature %d: invalid polygon coordinates", i + 1)
+                    continue
             elif geometry.get('type') == 'Point' and 'coordinates' in geometry:
                 coords = geometry['coordinates']
                 if len(coords) >= 2:
+                    geometry['coordinates'] = round_coordinates(coords)
                     lon = coords[0]
                     lat = coords[1]
                     feature['lat'] = lat
                     feature['lon'] = lon
                 else:
-                    print(f"   ❌ Feature {i+1}: invalid point coordinates")
+                    log.debug("❌ Feature %d: invalid point coordinates", i + 1)
                     continue
             else:
-                print(f"   ⚠️ Feature {i+1}: unsupported geometry type: {geometry.get('type')}")
+                log.debug("⚠️ Feature %d: unsupported geometry type: %s", i + 1, geometry.get('type'))
+                continue
+            
+            k = check_index.get(i)
+            if k is None:
+                log.debug("❌ Feature %d: invalid point coordinates", i + 1)
                 continue
             
             # Validate Netherlands bounds
-            if not (50.0 <= lat <= 54.0 and 3.0 <= lon <= 8.0):
-                print(f"   ❌ Feature {i+1}: coordinates outside Netherlands bounds: {lat}, {lon}")
+            if not inside_bounds[k]:
+                log.debug("❌ Feature %d: coordinates outside Netherlands bounds: %s, %s", i + 1, lat, lon)
                 continue
             
             # Radius validation
-            if search_location and 'lat' in search_location and 'lon' in search_location:
-                R = 6371  # Earth's radius in km
-                lat1, lon1 = radians(search_location['lat']), radians(search_location['lon'])
-                lat2, lon2 = radians(lat), radians(lon)
-                dlat = lat2 - lat1
-                dlon = lon2 - lon1
-                a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                c = 2 * atan2(sqrt(a), sqrt(1-a))
-                distance = R * c
+            if distances is not None:
+                distance = distances[k]
                 if distance > radius_km:
-                    print(f"   ❌ Feature {i+1}: outside radius ({distance:.2f} km > {radius_km} km)")
+                    log.debug("❌ Feature %d: outside radius (%.2f km > %s km)", i + 1, distance, radius_km)
                     continue
             
             # Ensure required fields
@@ -312,40 +680,41 @@ def validate_and_fix_features(features, search_location=None, radius_km=15):
                                  feature.get('properties', {}).get('perceelnummer', f"Feature {i+1}"))
             
             if 'description' not in feature:
-                props = feature.get('properties', {})
-                desc_parts = []
-                if props.get('kadastraleGrootteWaarde'):
-                    area_m2 = float(props['kadastraleGrootteWaarde'])
-                    desc_parts.append(f"Area: {area_m2:.0f} m² ({(area_m2/10000):.2f} ha)")
-                if props.get('perceelnummer'):
-                    desc_parts.append(f"Parcel: {props['perceelnummer']}")
-                if props.get('bouwjaar'):
-                    desc_parts.append(f"Built: {props['bouwjaar']}")
-                if props.get('oppervlakte'):
-                    desc_parts.append(f"Area: {props['oppervlakte']}m²")
-                if props.get('status'):
-                    desc_parts.append(f"Status: {props['status']}")
-                if props.get('bodemgebruik'):
-                    desc_parts.append(f"Land Use: {props['bodemgebruik']}")
-                feature['description'] = " | ".join(desc_parts) if desc_parts else "PDOK spatial feature"
+                feature['description'] = _describe_feature(feature.get('properties', {}))
             
-            valid_features.append(feature)
-            print(f"   ✅ Feature {i+1}: valid ({feature['name']})")
+            valid_features.append(_sanitize_feature(feature))
+            log.debug("✅ Feature %d: valid (%s)", i + 1, feature['name'])
         
         except Exception as e:
-            print(f"   ❌ Feature {i+1} validation error: {e}")
+            log.warning("❌ Feature %d validation error: %s", i + 1, e)
             continue
     
     return valid_features
 
-def create_flexible_legend_data(features, layer_type):
+# (label, color, substring of the lowercased 'bodemgebruik' value)
+LAND_USE_CATEGORIES = (
+    ("Agricultural", "#22c55e", "agrarisch"),
+    ("Built-up", "#ef4444", "bebouwd"),
+    ("Forest", "#16a34a", "bos"),
+    ("Water", "#3b82f6", "water"),
+)
+
+# Legend colors for the construction-year eras, in ERA_LABELS order
+ERA_COLORS = ("#8B0000", "#FF4500", "#32CD32", "#1E90FF", "#FF1493")
+
+@lru_cache(maxsize=64)
+def legend_title(layer_type: str) -> str:
+    """Legend heading for a layer type, e.g. 'bestandbodemgebruik' -> '📊 Bestandbodemgebruik Features'."""
+    return f"📊 {layer_type.replace('_', ' ').title()} Features"
+
+def create_flexible_legend_data(features, layer_type, columns=None):
     """Create enhanced legend data for all layer types."""
     if not features or len(features) == 0:
         return None
     
     legend_data = {
         "layer_type": layer_type,
-        "title": f"📊 {layer_type.replace('_', ' ').title()} Features",
+        "title": legend_title(layer_type),
         "statistics": {
             "total_features": len(features),
             "data_source": "PDOK Netherlands"
@@ -354,14 +723,15 @@ def create_flexible_legend_data(features, layer_type):
     
     if layer_type == "bag":
         legend_data["description"] = "Building data from Dutch Buildings and Addresses Database"
+        # One bucketing pass over the year column; a missing or zero year is unknown
+        counts = era_counts((columns or build_feature_columns(features))["year"])
         legend_data["categories"] = [
-            {"label": "Historic (< 1900)", "color": "#8B0000", "count": sum(1 for f in features if f.get('properties', {}).get('bouwjaar', 0) and int(f['properties']['bouwjaar']) < 1900)},
-            {"label": "Pre-war (1900-1949)", "color": "#FF4500", "count": sum(1 for f in features if f.get('properties', {}).get('bouwjaar', 0) and 1900 <= int(f['properties']['bouwjaar']) < 1950)},
-            {"label": "Post-war (1950-1979)", "color": "#32CD32", "count": sum(1 for f in features if f.get('properties', {}).get('bouwjaar', 0) and 1950 <= int(f['properties']['bouwjaar']) < 1980)},
-            {"label": "Late 20th C (1980-1999)", "color": "#1E90FF", "count": sum(1 for f in features if f.get('properties', {}).get('bouwjaar', 0) and 1980 <= int(f['properties']['bouwjaar']) < 2000)},
-            {"label": "Modern (2000+)", "color": "#FF1493", "count": sum(1 for f in features if f.get('properties', {}).get('bouwjaar', 0) and int(f['properties']['bouwjaar']) >= 2000)},
-            {"label": "Unknown Age", "color": "#808080", "count": sum(1 for f in features if not f.get('properties', {}).get('bouwjaar'))}
+            {"label": label, "color": color, "count": count}
+            for label, color, count in zip(ERA_LABELS, ERA_COLORS, counts)
         ]
+        legend_data["categories"].append(
+            {"label": "Unknown Age", "color": "#808080", "count": len(features) - sum(counts)}
+        )
     elif layer_type == "cadastral":
         legend_data["description"] = "Cadastral parcel data from Dutch Land Registry"
         legend_data["categories"] = [
@@ -371,11 +741,11 @@ def create_flexible_legend_data(features, layer_type):
         ]
     elif layer_type == "bestandbodemgebruik":
         legend_data["description"] = "Land use data from CBS Netherlands"
+        # Lowercase each land-use value once, then match every category against it
+        land_uses = [str(f.get('properties', {}).get('bodemgebruik') or '').lower() for f in features]
         legend_data["categories"] = [
-            {"label": "Agricultural", "color": "#22c55e", "count": sum(1 for f in features if f.get('properties', {}).get('bodemgebruik', '').lower().includes('agrarisch'))},
-            {"label": "Built-up", "color": "#ef4444", "count": sum(1 for f in features if f.get('properties', {}).get('bodemgebruik', '').lower().includes('bebouwd'))},
-            {"label": "Forest", "color": "#16a34a", "count": sum(1 for f in features if f.get('properties', {}).get('bodemgebruik', '').lower().includes('bos'))},
-            {"label": "Water", "color": "#3b82f6", "count": sum(1 for f in features if f.get('properties', {}).get('bodemgebruik', '').lower().includes('water'))}
+            {"label": label, "color": color, "count": sum(1 for use in land_uses if term in use)}
+            for label, color, term in LAND_USE_CATEGORIES
         ]
     elif layer_type == "natura2000":
         legend_data["description"] = "Protected areas from Natura 2000"
@@ -390,135 +760,351 @@ def create_flexible_legend_data(features, layer_type):
     
     return legend_data
 
-def extract_search_location_from_response(response_text, features):
-    """Extract fallback search location from features."""
+def extract_search_location_from_response(response_text, features, columns=None):
+    """
+    Extract fallback search location from the centroids of validated features.
+    Validated features always carry a geometry, so only lat/lon are checked.
+    """
     try:
-        if features and len(features) > 0:
-            lats = []
-            lons = []
-            for feature in features:
-                if 'lat' in feature and 'lon' in feature:
-                    lat, lon = feature['lat'], feature['lon']
-                    if isinstance(lat, (int, float)) and isinstance(lon, (int, float)):
-                        lats.append(lat)
-                        lons.append(lon)
-                elif 'geometry' in feature and feature['geometry']:
-                    geom = feature['geometry']
-                    if geom.get('type') == 'Point' and 'coordinates' in geom:
-                        coords = geom['coordinates']
-                        if len(coords) >= 2:
-                            lons.append(coords[0])
-                            lats.append(coords[1])
-                    elif geom.get('type') == 'Polygon' and 'coordinates' in geom:
-                        coords = geom['coordinates'][0]
-                        if coords:
-                            ring_lons = [c[0] for c in coords if len(c) >= 2]
-                            ring_lats = [c[1] for c in coords if len(c) >= 2]
-                            if ring_lons and ring_lats:
-                                lons.append(sum(ring_lons) / len(ring_lons))
-                                lats.append(sum(ring_lats) / len(ring_lats))
-            if lats and lons:
-                return {
-                    "lat": sum(lats) / len(lats),
-                    "lon": sum(lons) / len(lons),
-                    "name": "Search Area",
-                    "source": "feature_centroid"
-                }
+        center = mean_location(columns or build_feature_columns(features))
+        if center:
+            return {
+                "lat": center[0],
+                "lon": center[1],
+                "name": "Search Area",
+                "source": "feature_centroid"
+            }
     except Exception as e:
-        print(f"⚠️ Error extracting location: {e}")
+        log.warning("⚠️ Error extracting location: %s", e)
     return None
 
+# Streamed responses are flushed in chunks of roughly this many bytes
+JSON_STREAM_CHUNK_BYTES = 64 * 1024
+JSON_STREAM_GZIP_LEVEL = 1
+
+def _json_default(obj):
+    """Types the JSON encoders do not serialize natively."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, '__geo_interface__'):
+        return obj.__geo_interface__
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()  # NumPy array or scalar
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _encode_json(obj) -> bytes:
+    """Encode to JSON bytes with orjson (numpy-aware), or the stdlib without it."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(
+            obj,
+            default=_json_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(obj, default=_json_default).encode('utf-8')
+
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider on orjson, so jsonify() and request.json skip the stdlib codec."""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return _encode_json(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+if ORJSON_AVAILABLE:
+    app.json = OrjsonJSONProvider(app)
+
+def _json_response(obj):
+    """JSON response encoded in one piece."""
+    return Response(_encode_json(obj), mimetype='application/json')
+
+def _streamed_json_response(payload: dict, stream_key: str = 'geojson_data', items_cache_key: Optional[str] = None):
+    """
+    JSON response whose stream_key list is encoded item by item and sent in
+    chunks, so the client starts parsing while later features are encoded.
+    With items_cache_key the encoded list is kept in encoded_features_cache
+    and sent from there the next time the same key is passed.
+    """
+    items = payload.get(stream_key) or []
+    head = {k: v for k, v in payload.items() if k != stream_key}
+    
+    def generate():
+        opening = _encode_json(head)[:-1]
+        yield opening + (b',' if head else b'') + _encode_json(stream_key) + b':['
+        cached = encoded_features_cache.get(items_cache_key) if items_cache_key else None
+        if cached is not None:
+            for start in range(0, len(cached), JSON_STREAM_CHUNK_BYTES):
+                yield cached[start:start + JSON_STREAM_CHUNK_BYTES]
+            yield b']}'
+            return
+        buffer, size, encoded_items = [], 0, []
+        for i, item in enumerate(items):
+            encoded = _encode_json(item)
+            buffer.append(b',' + encoded if i else encoded)
+            size += len(encoded)
+            if size >= JSON_STREAM_CHUNK_BYTES:
+                chunk = b''.join(buffer)
+                encoded_items.append(chunk)
+                yield chunk
+                buffer, size = [], 0
+        encoded_items.append(b''.join(buffer))
+        if items_cache_key:
+            encoded_features_cache.set(items_cache_key, b''.join(encoded_items))
+        buffer.append(b']}')
+        yield b''.join(buffer)
+    
+    if not request.accept_encodings['gzip']:
+        return Response(generate(), mimetype='application/json')
+    response = Response(_gzip_chunks(generate()), mimetype='application/json')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def _gzip_chunks(chunks):
+    """gzip a byte stream incrementally, flushing after each chunk so the client can decode as it arrives."""
+    compressor = zlib.compressobj(JSON_STREAM_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
 # Flask routes
 @app.route('/')
 def index():
     return render_template('base.html')
 
+def build_query_response(result) -> Tuple[dict, bool]:
+    """
+    Turn an agent result into the /api/query payload and update the map state.
+    Also returns whether the answer is worth caching: it parsed without a
+    fallback and produced at least one valid feature.
+    """
+    log.debug("🔍 Result type: %s", type(result))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("🔍 Result preview: %s...", str(result)[:200])
+    
+    # Process response
+    parsed = True
+    try:
+        structured_response = result if isinstance(result, dict) else safe_json_parse(str(result))
+        parsed = structured_response.get('layer_type') != 'error'
+        log.debug("✅ Parsed response")
+    except Exception as parse_error:
+        log.error("❌ Parse error: %s", parse_error)
+        parsed = False
+        structured_response = {
+            "text_description": "Formatting issue. Try a simpler query.",
+            "geojson_data": [],
+            "search_location": None,
+            "layer_type": "unknown"
+        }
+    
+    # Extract components
+    response_text = structured_response.get('text_description', 'Analysis completed')
+    geojson_data = structured_response.get('geojson_data', [])
+    search_location = structured_response.get('search_location')
+    layer_type = structured_response.get('layer_type', 'features')
+    log.info("📊 Raw features: %d", len(geojson_data))
+    
+    # Validate features
+    max_features = 500 if layer_type == "cadastral" else 100
+    valid_features = validate_and_fix_features(
+        geojson_data,
+        search_location=search_location,
+        radius_km=15
+    )
+    log.info("✅ Valid features: %d", len(valid_features))
+    
+    # Create legend
+    columns = build_feature_columns(valid_features)
+    legend_data = create_flexible_legend_data(valid_features, layer_type, columns)
+    
+    # Fallback location
+    if not search_location and valid_features:
+        search_location = extract_search_location_from_response(response_text, valid_features, columns)
+    
+    # Update state
+    update_map_state(
+        features=tuple(valid_features),
+        columns=columns,
+        layer_type=layer_type,
+        search_location=search_location,
+        last_updated=now_iso()
+    )
+    
+    return {
+        "response": response_text,
+        "geojson_data": valid_features[:max_features],
+        "search_location": search_location,
+        "layer_type": layer_type,
+        "legend_data": legend_data,
+        "agent_type": "smolagents"
+    }, parsed and bool(valid_features)
+
+def error_response_payload(error: Exception) -> dict:
+    """Payload returned to the client when a query fails."""
+    error_msg = f"Processing error: {str(error)}"
+    log.exception("❌ %s", error_msg)
+    return {
+        "error": error_msg,
+        "response": "Error processing request. Try 'Show buildings in Amsterdam'.",
+        "geojson_data": [],
+        "search_location": None,
+        "layer_type": "unknown",
+        "agent_type": "error"
+    }
+
+MAX_QUERY_LENGTH = 2000
+
+def read_query_text() -> Optional[str]:
+    """The request's query text, or None when the body has no usable query."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None
+    query_text = data.get('query')
+    if not isinstance(query_text, str) or not query_text.strip() or len(query_text) > MAX_QUERY_LENGTH:
+        return None
+    return query_text.strip()
+
+def invalid_query_response():
+    return jsonify({"error": f"Expected a JSON body with a non-empty 'query' of at most {MAX_QUERY_LENGTH} characters"}), 400
+
+# Agent runs allowed at once per process. Further queries wait for a slot
+# and are answered with 503 after AGENT_QUEUE_TIMEOUT seconds, so a burst
+# queues here instead of piling up LLM calls and rate-limit retries.
+MAX_CONCURRENT_AGENT_RUNS = int(os.getenv('MAX_CONCURRENT_AGENT_RUNS', '8'))
+AGENT_QUEUE_TIMEOUT = float(os.getenv('AGENT_QUEUE_TIMEOUT', '60'))
+_agent_slots = threading.BoundedSemaphore(MAX_CONCURRENT_AGENT_RUNS)
+
+class AgentBusyError(RuntimeError):
+    """No agent slot became free within AGENT_QUEUE_TIMEOUT."""
+
+@contextmanager
+def agent_slot():
+    """Hold one of the MAX_CONCURRENT_AGENT_RUNS slots for the duration of a run."""
+    if not _agent_slots.acquire(timeout=AGENT_QUEUE_TIMEOUT):
+        raise AgentBusyError(f"All {MAX_CONCURRENT_AGENT_RUNS} agents are busy, try again shortly")
+    try:
+        yield
+    finally:
+        _agent_slots.release()
+
+def wants_event_stream() -> bool:
+    """True when the client prefers Server-Sent Events over a single JSON body."""
+    accepted = request.accept_mimetypes
+    return accepted['text/event-stream'] > accepted['application/json']
+
 @app.route('/api/query', methods=['POST'])
 def query():
-    """Handle queries with improved smolagents approach."""
-    global current_map_state
-    print("\n" + "="*50)
-    print("🧠 PROCESSING QUERY")
-    print("="*50)
+    """Handle queries with improved smolagents approach; SSE clients get query_stream()."""
+    if wants_event_stream():
+        return query_stream()
+    log.info("🧠 PROCESSING QUERY")
     
-    data = request.json
-    query_text = data.get('query', '')
-    print(f"Query: {query_text}")
-    current_map_state["last_query"] = query_text
+    query_text = read_query_text()
+    if query_text is None:
+        return invalid_query_response()
+    log.info("Query: %s", query_text)
+    task = build_agent_task(query_text, update_map_state(last_query=query_text))
     
     try:
-        print("🚀 Running agent...")
-        result = agent.run(query_text)
-        print(f"🔍 Result type: {type(result)}")
-        print(f"🔍 Result preview: {str(result)[:200]}...")
-        
-        # Process response
-        try:
-            structured_response = result if isinstance(result, dict) else safe_json_parse(str(result))
-            print("✅ Parsed response")
-        except Exception as parse_error:
-            print(f"❌ Parse error: {parse_error}")
-            structured_response = {
-                "text_description": "Formatting issue. Try a simpler query.",
-                "geojson_data": [],
-                "search_location": None,
-                "layer_type": "unknown"
-            }
-        
-        # Extract components
-        response_text = structured_response.get('text_description', 'Analysis completed')
-        geojson_data = structured_response.get('geojson_data', [])
-        search_location = structured_response.get('search_location')
-        layer_type = structured_response.get('layer_type', 'features')
-        print(f"📊 Raw features: {len(geojson_data)}")
-        
-        # Validate features
-        max_features = 500 if layer_type == "cadastral" else 100
-        valid_features = validate_and_fix_features(
-            geojson_data,
-            search_location=search_location,
-            radius_km=15
-        )
-        print(f"✅ Valid features: {len(valid_features)}")
+        cache_key = agent_cache_key(task)
+        result = agent_result_cache.get(cache_key)
+        if result is not None:
+            log.info("⚡ Agent result served from cache")
+            payload, _ = build_query_response(result)
+        else:
+            log.info("🚀 Running agent...")
+            warm_connections()
+            analysis_calls = _map_analysis_calls
+            with agent_slot():
+                result = get_agent().run(task)
+            payload, cacheable = build_query_response(result)
+            if not remember_agent_result(cache_key, result, cacheable, analysis_calls):
+                cache_key = None
         
-        # Update state
-        current_map_state["features"] = valid_features
-        current_map_state["layer_type"] = layer_type
-        current_map_state["search_location"] = search_location
-        
-        # Create legend
-        legend_data = create_flexible_legend_data(valid_features, layer_type)
-        
-        # Fallback location
-        if not search_location and valid_features:
-            search_location = extract_search_location_from_response(response_text, valid_features)
-            current_map_state["search_location"] = search_location
-        
-        return jsonify({
-            "response": response_text,
-            "geojson_data": valid_features[:max_features],
-            "search_location": search_location,
-            "layer_type": layer_type,
-            "legend_data": legend_data,
-            "agent_type": "smolagents"
-        })
+        return _streamed_json_response(payload, items_cache_key=cache_key)
         
+    except AgentBusyError as e:
+        return _json_response(error_response_payload(e)), 503
+    
     except Exception as e:
-        error_msg = f"Processing error: {str(e)}"
-        print(f"❌ {error_msg}")
-        traceback.print_exc()
-        return jsonify({
-            "error": error_msg,
-            "response": "Error processing request. Try 'Show buildings in Amsterdam'.",
-            "geojson_data": [],
-            "search_location": None,
-            "layer_type": "unknown",
-            "agent_type": "error"
-        })
+        return _json_response(error_response_payload(e))
     
     finally:
-        print("🎉 PROCESSING COMPLETED")
-        print("="*50 + "\n")
+        log.info("🎉 PROCESSING COMPLETED")
+
+def remember_agent_result(cache_key: str, result, cacheable: bool, analysis_calls: int) -> bool:
+    """
+    Cache a fresh agent result unless it failed to parse, has no features,
+    or read the map (the analysis counter moved since analysis_calls), so a
+    one-off failure is not replayed to every user. Returns whether it was stored.
+    """
+    if not cacheable or _map_analysis_calls != analysis_calls:
+        return False
+    agent_result_cache.set(cache_key, result)
+    # A fresh answer replaces whatever was encoded for the old one
+    encoded_features_cache.set(cache_key, None)
+    return True
+
+def _sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {_encode_json(data).decode('utf-8')}\n\n"
+
+@app.route('/api/query/stream', methods=['POST'])
+def query_stream():
+    """Stream a query over SSE: LLM tokens, agent steps, then the final /api/query payload."""
+    query_text = read_query_text()
+    if query_text is None:
+        return invalid_query_response()
+    log.info("🧠 Streaming query: %s", query_text)
+    task = build_agent_task(query_text, update_map_state(last_query=query_text))
+    
+    def generate():
+        try:
+            cache_key = agent_cache_key(task)
+            result = agent_result_cache.get(cache_key)
+            if result is not None:
+                log.info("⚡ Agent result served from cache")
+                yield _sse_event("final", build_query_response(result)[0])
+                return
+            
+            warm_connections()
+            analysis_calls = _map_analysis_calls
+            thread_agent = get_agent()
+            with agent_slot():
+                thread_agent.stream_outputs = True
+                try:
+                    for event in thread_agent.run(task, stream=True):
+                        if isinstance(event, FinalAnswerStep):
+                            result = event.final_answer
+                        elif isinstance(event, ActionStep):
+                            yield _sse_event("step", {
+                                "step": event.step_number,
+                                "observations": (event.observations or "")[:1000],
+                                "error": str(event.error) if event.error else None
+                            })
+                        elif getattr(event, 'content', None):
+                            yield _sse_event("token", {"content": event.content})
+                finally:
+                    thread_agent.stream_outputs = False
+            
+            payload, cacheable = build_query_response(result)
+            remember_agent_result(cache_key, result, cacheable, analysis_calls)
+            yield _sse_event("final", payload)
+        except Exception as e:
+            yield _sse_event("error", error_response_payload(e))
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/test-prompt', methods=['GET'])
 def test_prompt():
@@ -531,30 +1117,24 @@ def test_prompt():
             "template_sections": list(prompt_templates.keys()),
             "system_prompt_length": len(system_prompt),
             "system_prompt_preview": system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         })
     except Exception as e:
         return jsonify({
             "prompt_loaded": False,
             "error": str(e),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         })
 
 @app.route('/api/map-state', methods=['GET'])
 def get_map_state():
     """Get current map state."""
-    return jsonify(current_map_state)
+    return _streamed_json_response(current_map_state().to_dict(), stream_key='features')
 
 @app.route('/api/clear-map', methods=['POST'])
 def clear_map():
     """Clear map."""
-    global current_map_state
-    current_map_state = {
-        "features": [],
-        "search_location": None,
-        "layer_type": None,
-        "last_query": None
-    }
+    update_map_state(reset=True)
     return jsonify({"success": True})
 
 @app.route('/api/health', methods=['GET'])
@@ -577,9 +1157,9 @@ def health_check():
     
     return jsonify({
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso(),
         "tools_available": tools_available,
-        "agent_ready": agent is not None,
+        "agent_ready": bool(agent_tools),
         "prompt_status": prompt_status
     })
 
@@ -611,6 +1191,7 @@ if __name__ == '__main__':
     print(f"\n🌐 http://localhost:5000")
     print("  📊 http://localhost:5000/api/health")
     print("  🧪 http://localhost:5000/api/test-prompt")
+    print("  📡 http://localhost:5000/api/query/stream (SSE)")
     print("="*40)
     
     app.run(debug=True, port=5000, host='0.0.0.0')
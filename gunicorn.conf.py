@@ -0,0 +1,26 @@
+# gunicorn.conf.py - Production server settings: gunicorn app:app
+
+"""
+Threaded gunicorn setup for the PDOK assistant.
+
+A query is almost entirely waiting on the LLM and PDOK, and requests,
+pyproj and the LLM client release the GIL while they wait, so one process
+with a pool of threads serves concurrent users. Keep a single worker: the
+map state lives in process memory, and a second worker would answer
+/api/map-state from a different copy than the one /api/query updated.
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# An agent run makes several LLM and PDOK round-trips
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
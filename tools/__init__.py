@@ -13,6 +13,8 @@ CORE PHILOSOPHY:
 - Minimal tool set (not tool proliferation)
 """
 
+from tools.text_patterns import keyword_pattern
+
 # Essential Discovery Tool
 from tools.enhanced_discovery_tool import IntentDrivenPDOKDiscoveryTool
 
@@ -171,6 +173,14 @@ INTENT_SERVICE_MAPPING = {
     }
 }
 
+# One alternation per intent, compiled once from INTENT_SERVICE_MAPPING. Keywords
+# match as substrings, so Dutch compounds ("kadasterpercelen") and derived
+# words ("reconstruction") still count.
+INTENT_RULES = tuple(
+    (intent, keyword_pattern(info["keywords"]))
+    for intent, info in INTENT_SERVICE_MAPPING.items()
+)
+
 def get_service_for_intent(user_query: str) -> dict:
     """
     Helper function to map user query to appropriate service.
@@ -178,14 +188,16 @@ def get_service_for_intent(user_query: str) -> dict:
     """
     query_lower = user_query.lower()
     
-    for intent, service_info in INTENT_SERVICE_MAPPING.items():
-        if any(keyword in query_lower for keyword in service_info["keywords"]):
+    for intent, keyword_re in INTENT_RULES:
+        matches = len(set(keyword_re.findall(query_lower)))
+        if matches:
+            service_info = INTENT_SERVICE_MAPPING[intent]
             return {
                 "intent": intent,
                 "recommended_service": service_info["service"],
                 "service_url": service_info["url"],
                 "primary_layer": service_info["layer"],
-                "confidence": "high" if len([k for k in service_info["keywords"] if k in query_lower]) > 1 else "medium"
+                "confidence": "high" if matches > 1 else "medium"
             }
     
     return {
@@ -1,9 +1,12 @@
 # tools/coordinate_conversion_tool.py
 
+import logging
 import math
 from smolagents import Tool
 from typing import Dict, Tuple
-from pyproj import Transformer
+from tools.spatial_kernels import WGS84_TO_RD
+
+log = logging.getLogger(__name__)
 
 class CoordinateConversionTool(Tool):
     """
@@ -42,7 +45,7 @@ class CoordinateConversionTool(Tool):
     def forward(self, latitude: float, longitude: float) -> Dict:
         """Convert WGS84 coordinates to RD New using pyproj."""
         try:
-            print(f"🔄 Converting WGS84 ({longitude:.6f}, {latitude:.6f}) to RD New...")
+            log.info("🔄 Converting WGS84 (%.6f, %.6f) to RD New...", longitude, latitude)
 
             # Validate input coordinates are in Netherlands bounds
             if not (50.5 <= latitude <= 54.0 and 3.0 <= longitude <= 7.5):
@@ -52,7 +55,7 @@ class CoordinateConversionTool(Tool):
 
             rd_x, rd_y = self._wgs84_to_rd_new(latitude, longitude)
 
-            print(f"✅ RD New coordinates: X={rd_x:.2f}, Y={rd_y:.2f}")
+            log.info("✅ RD New coordinates: X=%.2f, Y=%.2f", rd_x, rd_y)
 
             radius_m = 1000
             bbox_min_x = rd_x - radius_m
@@ -78,8 +81,7 @@ class CoordinateConversionTool(Tool):
 
     def _wgs84_to_rd_new(self, lat: float, lon: float) -> Tuple[float, float]:
         """Use pyproj to convert WGS84 to RD New (EPSG:28992)."""
-        transformer = Transformer.from_crs("EPSG:4326", "EPSG:28992", always_xy=True)
-        return transformer.transform(lon, lat)
+        return WGS84_TO_RD.transform(lon, lat)
 
 
 class CreateRDBoundingBoxTool(Tool):
@@ -117,7 +119,7 @@ class CreateRDBoundingBoxTool(Tool):
     def forward(self, rd_x: float, rd_y: float, radius_km: float = 1.0) -> Dict:
         """Create RD New bounding box around center point."""
         try:
-            print(f"📦 Creating RD New bbox around ({rd_x:.2f}, {rd_y:.2f}) with {radius_km}km radius")
+            log.info("📦 Creating RD New bbox around (%.2f, %.2f) with %skm radius", rd_x, rd_y, radius_km)
             
             # Convert radius to meters
             radius_m = radius_km * 1000
@@ -131,7 +133,7 @@ class CreateRDBoundingBoxTool(Tool):
             # Create bbox string for PDOK WFS
             bbox_string = f"{min_x},{min_y},{max_x},{max_y}"
             
-            print(f"✅ RD New bbox: {bbox_string}")
+            log.info("✅ RD New bbox: %s", bbox_string)
             
             return {
                 "bbox": bbox_string,
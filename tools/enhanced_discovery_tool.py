@@ -2,11 +2,44 @@
 
 import requests
 import json
+import logging
+import re
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from smolagents import Tool
 import math
 from typing import Dict, List, Optional, Union, Tuple
+from tools.pdok_http import pdok_get, response_json
+from tools.spatial_kernels import WGS84_TO_RD, RD_TO_WGS84
+from tools.text_patterns import keyword_pattern
+
+log = logging.getLogger(__name__)
+
+
+# Keyword sets for attribute and value classification
+AREA_ATTR_WORDS = ('oppervlakte', 'grootte', 'area', 'shape_area')
+CLASSIFICATION_ATTR_WORDS = ('bodemgebruik', 'categorie', 'klasse', 'type', 'status')
+AGRICULTURAL_TERMS = ('agrarisch', 'landbouw', 'akkerbouw', 'veeteelt', 'grasland', 'weide')
+URBAN_TERMS = ('bebouwd', 'stedelijk', 'urban', 'woongebied', 'industrie', 'wonen')
+NATURAL_TERMS = ('bos', 'natuur', 'water', 'natuurlijk', 'recreatie')
+ACTIVE_BUILDING_TERMS = ('gebruik', 'actief', 'in gebruik', 'operationeel')
+PRIMARY_LAYERS = (
+    "bestand_bodemgebruik_2015",
+    "bag:pand",
+    "kadastralekaart:Perceel",
+    "natura2000:natura2000",
+    "cbs_gemeente"
+)
+
+
+# One scan per string instead of one "term in value" check per keyword
+AREA_ATTR_RE = keyword_pattern(AREA_ATTR_WORDS)
+CLASSIFICATION_ATTR_RE = keyword_pattern(CLASSIFICATION_ATTR_WORDS)
+AGRICULTURAL_RE = keyword_pattern(AGRICULTURAL_TERMS, re.IGNORECASE)
+URBAN_RE = keyword_pattern(URBAN_TERMS, re.IGNORECASE)
+NATURAL_RE = keyword_pattern(NATURAL_TERMS, re.IGNORECASE)
+ACTIVE_BUILDING_RE = keyword_pattern(ACTIVE_BUILDING_TERMS, re.IGNORECASE)
+PRIMARY_LAYER_RE = keyword_pattern(PRIMARY_LAYERS)
 
 class IntentDrivenPDOKDiscoveryTool(Tool):
     """
@@ -137,13 +170,17 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 }
             }
         }
+        
+        # The process-wide transformers from spatial_kernels (None without pyproj)
+        self.transformer_to_rd = WGS84_TO_RD
+        self.transformer_to_wgs84 = RD_TO_WGS84
     
     def forward(self, service_name: str, get_attributes: Optional[bool] = True, 
                 sample_data: Optional[bool] = True, location_center: Optional[Union[List[float], Dict]] = None,
                 sample_size: Optional[int] = 25) -> Dict:
         """FIXED: Discover specific PDOK service with robust error handling."""
         try:
-            print(f"🎯 FIXED Enhanced PDOK discovery: {service_name}")
+            log.info("🎯 FIXED Enhanced PDOK discovery: %s", service_name)
             
             # Handle aliases
             if service_name in ["landuse", "land_use", "bodemgebruik"]:
@@ -160,7 +197,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 
         except Exception as e:
             error_msg = f"Enhanced discovery error: {str(e)}"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
             return {"error": error_msg, "discovery_success": False}
     
     def _discover_single_service(self, service_name: str, get_attributes: bool, 
@@ -169,7 +206,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
         """FIXED: Discover service with proper error handling."""
         config = self.services[service_name]
         
-        print(f"📡 Discovering {service_name}: {config['name']}")
+        log.info("📡 Discovering %s: %s", service_name, config['name'])
         
         # Step 1: Basic service capabilities
         capabilities = self._get_service_capabilities(config["url"], get_attributes)
@@ -180,11 +217,11 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
         # Step 2: Sample data analysis (if requested)
         sample_analysis = {"sample_success": False}
         if sample_data:
-            print(f"🧪 Sampling data for attribute value analysis...")
+            log.info("🧪 Sampling data for attribute value analysis...")
             sample_analysis = self._analyze_sample_data(config, location_center, sample_size)
         
         # Step 3: Intelligent recommendations
-        print(f"🧠 Generating intelligent filter recommendations...")
+        log.info("🧠 Generating intelligent filter recommendations...")
         recommendations = self._generate_filter_recommendations(config, sample_analysis, capabilities)
         
         result = {
@@ -210,8 +247,8 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 'request': 'GetCapabilities'
             }
             
-            print(f"  📡 Requesting capabilities from: {service_url}")
-            response = requests.get(service_url, params=params, timeout=15)
+            log.debug("  📡 Requesting capabilities from: %s", service_url)
+            response = pdok_get(service_url, params=params, timeout=15)
             response.raise_for_status()
             
             # Parse XML to extract layer info
@@ -231,7 +268,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                         
                         # Get attributes if requested
                         if get_attributes and self._is_primary_layer(name_elem.text):
-                            print(f"  🔬 Getting attributes for: {name_elem.text}")
+                            log.debug("  🔬 Getting attributes for: %s", name_elem.text)
                             attributes = self._get_layer_attributes(service_url, name_elem.text)
                             layer_info["attributes"] = attributes
                         
@@ -245,7 +282,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             
         except Exception as e:
             error_msg = f"Could not get capabilities: {str(e)}"
-            print(f"  ❌ {error_msg}")
+            log.error("  ❌ %s", error_msg)
             return {"error": error_msg}
     
     def _analyze_sample_data(self, config: Dict, location_center: Optional[Union[List[float], Dict]], 
@@ -256,10 +293,10 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             layer_name = config["primary_layer"]
             coordinate_system = config["coordinate_system"]
             
-            print(f"   🌐 Sampling from: {service_url}")
-            print(f"   📦 Layer: {layer_name}")
-            print(f"   📊 Sample size: {sample_size}")
-            print(f"   🗺️ Coordinate system: {coordinate_system}")
+            log.debug("   🌐 Sampling from: %s", service_url)
+            log.debug("   📦 Layer: %s", layer_name)
+            log.debug("   📊 Sample size: %s", sample_size)
+            log.debug("   🗺️ Coordinate system: %s", coordinate_system)
             
             # Build sample request parameters
             params = {
@@ -277,17 +314,17 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 bbox = self._create_sample_bbox_fixed(location_center, coordinate_system)
                 if bbox:
                     params['bbox'] = f"{bbox},{coordinate_system}"
-                    print(f"   📍 Using spatial filter: {bbox}")
+                    log.debug("   📍 Using spatial filter: %s", bbox)
                 else:
-                    print(f"   ⚠️ Could not create spatial filter, using service default area")
+                    log.warning("   ⚠️ Could not create spatial filter, using service default area")
             
-            response = requests.get(service_url, params=params, timeout=30)
+            response = pdok_get(service_url, params=params, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
+            data = response_json(response)
             features = data.get('features', [])
             
-            print(f"   ✅ Retrieved {len(features)} sample features")
+            log.debug("   ✅ Retrieved %s sample features", len(features))
             
             if not features:
                 return {
@@ -300,7 +337,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             return self._perform_comprehensive_attribute_analysis(features, config)
             
         except Exception as e:
-            print(f"   ❌ Sample analysis error: {e}")
+            log.error("   ❌ Sample analysis error: %s", e)
             return {
                 "error": f"Could not analyze sample data: {str(e)}",
                 "sample_success": False
@@ -314,7 +351,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 if 'lat' in location_center and 'lon' in location_center:
                     lat, lon = float(location_center['lat']), float(location_center['lon'])
                 else:
-                    print(f"   ❌ Invalid location_center dict format: {location_center}")
+                    log.error("   ❌ Invalid location_center dict format: %s", location_center)
                     return None
             elif isinstance(location_center, (list, tuple)) and len(location_center) == 2:
                 coord1, coord2 = float(location_center[0]), float(location_center[1])
@@ -322,70 +359,65 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 # CRITICAL FIX: Check if these are already RD New coordinates
                 if coord1 > 10000 and coord2 > 10000:
                     # These are already RD New coordinates (X, Y)
-                    print(f"   ✅ FIXED: Detected input as RD New coordinates: X={coord1}, Y={coord2}")
+                    log.debug("   ✅ FIXED: Detected input as RD New coordinates: X=%s, Y=%s", coord1, coord2)
                     
                     if coordinate_system == "EPSG:28992":
                         # Use directly
                         x, y = coord1, coord2
                         buffer = 10000  # 10km in meters
                         bbox = f"{x-buffer},{y-buffer},{x+buffer},{y+buffer}"
-                        print(f"   🗺️ FIXED: RD New bbox created directly: {bbox}")
+                        log.debug("   🗺️ FIXED: RD New bbox created directly: %s", bbox)
                         return bbox
                     else:
                         # Convert RD New to WGS84 for WGS84 request
-                        try:
-                            import pyproj
-                            transformer = pyproj.Transformer.from_crs("EPSG:28992", "EPSG:4326", always_xy=True)
-                            lon, lat = transformer.transform(coord1, coord2)
-                            print(f"   🔄 FIXED: Converted RD New to WGS84: {lat}, {lon}")
-                        except ImportError:
-                            print(f"   ⚠️ PyProj not available for RD New to WGS84 conversion")
+                        if not self.transformer_to_wgs84:
+                            log.warning("   ⚠️ PyProj not available for RD New to WGS84 conversion")
                             return None
+                        lon, lat = self.transformer_to_wgs84.transform(coord1, coord2)
+                        log.debug("   🔄 FIXED: Converted RD New to WGS84: %s, %s", lat, lon)
                 else:
                     # These are WGS84 coordinates
                     lat, lon = coord1, coord2
-                    print(f"   ✅ FIXED: Detected input as WGS84 coordinates: lat={lat}, lon={lon}")
+                    log.debug("   ✅ FIXED: Detected input as WGS84 coordinates: lat=%s, lon=%s", lat, lon)
             else:
-                print(f"   ❌ Invalid location_center format: {location_center}")
+                log.error("   ❌ Invalid location_center format: %s", location_center)
                 return None
             
             # Now we have lat, lon in WGS84 format
-            print(f"   📍 FIXED: Processing WGS84 coordinates: lat={lat}, lon={lon}")
+            log.debug("   📍 FIXED: Processing WGS84 coordinates: lat=%s, lon=%s", lat, lon)
             
             if coordinate_system == "EPSG:4326":
                 # WGS84 - use degrees (approximately 10km radius)
                 buffer = 0.1
                 bbox = f"{lon-buffer},{lat-buffer},{lon+buffer},{lat+buffer}"
-                print(f"   🌐 FIXED: WGS84 bbox created: {bbox}")
+                log.debug("   🌐 FIXED: WGS84 bbox created: %s", bbox)
                 return bbox
             
             elif coordinate_system == "EPSG:28992":
                 # RD New - convert coordinates
+                if not self.transformer_to_rd:
+                    log.warning("   ⚠️ PyProj not available for coordinate transformation")
+                    return None
                 try:
-                    import pyproj
-                    print(f"   🔄 FIXED: Converting WGS84 to RD New...")
+                    log.debug("   🔄 FIXED: Converting WGS84 to RD New...")
                     
-                    transformer = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:28992", always_xy=True)
-                    x, y = transformer.transform(float(lon), float(lat))
+                    x, y = self.transformer_to_rd.transform(float(lon), float(lat))
                     
-                    print(f"   📍 FIXED: RD New coordinates: x={x:.2f}, y={y:.2f}")
+                    log.debug("   📍 FIXED: RD New coordinates: x=%.2f, y=%.2f", x, y)
                     
                     buffer = 10000  # 10km in meters
                     bbox = f"{x-buffer},{y-buffer},{x+buffer},{y+buffer}"
-                    print(f"   🗺️ FIXED: RD New bbox created: {bbox}")
+                    log.debug("   🗺️ FIXED: RD New bbox created: %s", bbox)
                     return bbox
                     
-                except ImportError:
-                    print("   ⚠️ PyProj not available for coordinate transformation")
-                    return None
                 except Exception as e:
-                    print(f"   ❌ FIXED: Coordinate transformation error: {e}")
+                    log.error("   ❌ FIXED: Coordinate transformation error: %s", e)
                     return None
             
             return None
             
         except Exception as e:
-            print(f"   ❌ FIXED: Error creating bbox: {e}")
+            log.error("   ❌ FIXED: Error creating bbox: %s", e)
             return None
     
     def _perform_comprehensive_attribute_analysis(self, features: List[Dict], config: Dict) -> Dict:
@@ -399,7 +431,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             numeric_fields = []
             area_fields = []
             
-            print(f"   🔍 Analyzing {len(features)} features for {analysis_focus}")
+            log.debug("   🔍 Analyzing %s features for %s", len(features), analysis_focus)
             
             # Analyze each feature
             for feature in features:
@@ -435,13 +467,13 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                     numeric_fields.append(attr_name)
                     
                     # Check if area field
-                    if any(keyword in attr_lower for keyword in ['oppervlakte', 'grootte', 'area', 'shape_area']):
+                    if AREA_ATTR_RE.search(attr_lower):
                         analysis["is_area"] = True
                         area_fields.append(attr_name)
                 
                 # Check if classification field
                 if (analysis["unique_count"] < 50 and analysis["unique_count"] > 1 and
-                    any(keyword in attr_lower for keyword in ['bodemgebruik', 'categorie', 'klasse', 'type', 'status'])):
+                    CLASSIFICATION_ATTR_RE.search(attr_lower)):
                     analysis["is_classification"] = True
                     classification_fields.append(attr_name)
                     
@@ -451,20 +483,20 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                         analysis["urban_values"] = self._find_urban_values(values_list)
                         analysis["natural_values"] = self._find_natural_values(values_list)
                         
-                        print(f"   🌾 {attr_name} agricultural values: {analysis['agricultural_values']}")
-                        print(f"   🏙️ {attr_name} urban values: {analysis['urban_values']}")
+                        log.debug("   🌾 %s agricultural values: %s", attr_name, analysis['agricultural_values'])
+                        log.debug("   🏙️ %s urban values: %s", attr_name, analysis['urban_values'])
                     
                     # Analyze for building status
                     elif analysis_focus == "building_characteristics":
                         analysis["active_values"] = self._find_active_building_values(values_list)
-                        print(f"   🏠 {attr_name} active values: {analysis['active_values']}")
+                        log.debug("   🏠 %s active values: %s", attr_name, analysis['active_values'])
                 
                 # Remove large values set to save memory
                 del analysis["values"]
             
-            print(f"   📊 Analysis complete: {len(classification_fields)} classification fields found")
+            log.debug("   📊 Analysis complete: %s classification fields found", len(classification_fields))
             if classification_fields:
-                print(f"   🏷️ Classification fields: {classification_fields}")
+                log.debug("   🏷️ Classification fields: %s", classification_fields)
             
             return {
                 "features_analyzed": len(features),
@@ -478,7 +510,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             }
             
         except Exception as e:
-            print(f"   ❌ Attribute analysis error: {e}")
+            log.error("   ❌ Attribute analysis error: %s", e)
             return {
                 "error": f"Attribute analysis failed: {str(e)}",
                 "sample_success": False
@@ -486,23 +518,19 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
     
     def _find_agricultural_values(self, values: List[str]) -> List[str]:
         """Find values that represent agricultural land use."""
-        agricultural_terms = ['agrarisch', 'landbouw', 'akkerbouw', 'veeteelt', 'grasland', 'weide']
-        return [v for v in values if any(term in v.lower() for term in agricultural_terms)]
+        return [v for v in values if AGRICULTURAL_RE.search(v)]
     
     def _find_urban_values(self, values: List[str]) -> List[str]:
         """Find values that represent urban/built-up land use."""
-        urban_terms = ['bebouwd', 'stedelijk', 'urban', 'woongebied', 'industrie', 'wonen']
-        return [v for v in values if any(term in v.lower() for term in urban_terms)]
+        return [v for v in values if URBAN_RE.search(v)]
     
     def _find_natural_values(self, values: List[str]) -> List[str]:
         """Find values that represent natural land use."""
-        natural_terms = ['bos', 'natuur', 'water', 'natuurlijk', 'recreatie']
-        return [v for v in values if any(term in v.lower() for term in natural_terms)]
+        return [v for v in values if NATURAL_RE.search(v)]
     
     def _find_active_building_values(self, values: List[str]) -> List[str]:
         """Find values that represent active/in-use buildings."""
-        active_terms = ['gebruik', 'actief', 'in gebruik', 'operationeel']
-        return [v for v in values if any(term in v.lower() for term in active_terms)]
+        return [v for v in values if ACTIVE_BUILDING_RE.search(v)]
     
     def _is_numeric_field(self, values: List[str]) -> bool:
         """Check if string values are actually numeric."""
@@ -601,15 +629,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
     
     def _is_primary_layer(self, layer_name: str) -> bool:
         """Check if this is a primary layer we should get attributes for."""
-        primary_layers = [
-            "bestand_bodemgebruik_2015",
-            "bag:pand",
-            "kadastralekaart:Perceel", 
-            "natura2000:natura2000",
-            "cbs_gemeente"
-        ]
-        
-        return any(primary in layer_name for primary in primary_layers)
+        return PRIMARY_LAYER_RE.search(layer_name) is not None
     
     def _get_layer_attributes(self, service_url: str, layer_name: str) -> Dict:
         """Get detailed attributes for a specific layer."""
@@ -621,7 +641,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
                 'typeName': layer_name
             }
             
-            response = requests.get(service_url, params=params, timeout=10)
+            response = pdok_get(service_url, params=params, timeout=10)
             response.raise_for_status()
             
             # Parse schema
@@ -648,7 +668,7 @@ class IntentDrivenPDOKDiscoveryTool(Tool):
             }
             
         except Exception as e:
-            print(f"    ⚠️ Could not get attributes for {layer_name}: {e}")
+            log.warning("    ⚠️ Could not get attributes for %s: %s", layer_name, e)
             return {"error": f"Could not get attributes: {str(e)}"}
 
 
@@ -2,9 +2,62 @@
 
 import requests
 import json
+import logging
 import re
 from typing import Dict, List, Optional, Union
 from smolagents import Tool
+from tools.pdok_http import pdok_get, response_json
+from tools.result_cache import ResultCache, cache_key, open_disk_cache
+from tools.text_patterns import keyword_pattern
+
+log = logging.getLogger(__name__)
+
+# Geocoding results change rarely; keep resolved locations for an hour in
+# memory and for a day on disk (when RESULT_CACHE_DIR is set)
+LOCATION_CACHE_TTL = 3600
+LOCATION_DISK_CACHE_TTL = 86400
+_location_cache = ResultCache(
+    maxsize=256, ttl=LOCATION_CACHE_TTL,
+    disk=open_disk_cache("locations", LOCATION_DISK_CACHE_TTL)
+)
+
+# Broad search types used when the targeted search finds nothing
+FALLBACK_SEARCH_TYPES = "adres,woonplaats,gemeente,weg"
+
+# Query patterns used for search-type detection, compiled once at import
+DIGITS_RE = re.compile(r'\d+')
+POSTCODE_RE = re.compile(r'\d{4}\s*[a-zA-Z]{2}')
+
+CITY_NAMES = (
+    'amsterdam', 'rotterdam', 'utrecht', 'groningen', 'eindhoven',
+    'tilburg', 'almere', 'breda', 'nijmegen', 'enschede', 'haarlem',
+    'arnhem', 'zaanstad', 'haarlemmermeer', 'zoetermeer', 'emmen'
+)
+STREET_WORDS = (
+    'straat', 'laan', 'weg', 'plein', 'kade', 'gracht',
+    'avenue', 'street', 'road', 'boulevard'
+)
+ADDRESS_WORDS = ('nummer', 'huisnummer', 'address')
+
+
+# Substring matching, as with the "word in query" checks these replace
+CITY_RE = keyword_pattern(CITY_NAMES)
+STREET_RE = keyword_pattern(STREET_WORDS)
+ADDRESS_WORD_RE = keyword_pattern(ADDRESS_WORDS)
+
+# Query cleanup: words dropped before searching, then phrase rewrites
+STOP_WORDS = frozenset(('the', 'de', 'het', 'een', 'a', 'an', 'near', 'around'))
+QUERY_REPLACEMENTS = (
+    ('train station', 'station'),
+    ('city center', 'centrum'),
+    ('central station', 'centraal'),
+)
+
+# Result ranking: base score per Locatieserver type (most specific first),
+# then the lowercased fields searched for query words and their weights
+DOC_TYPE_SCORES = {'adres': 35, 'postcode': 30, 'woonplaats': 25, 'gemeente': 20, 'weg': 15}
+DEFAULT_DOC_TYPE_SCORE = 5
+TEXT_MATCH_WEIGHTS = (('weergavenaam', 25), ('straatnaam', 20), ('woonplaatsnaam', 15), ('gemeentenaam', 12))
 
 class IntelligentLocationSearchTool(Tool):
     """
@@ -98,6 +151,11 @@ It intelligently selects search types, optimizes queries, and provides comprehen
                 'priority': 9
             }
         }
+        # Each type's keywords as a single alternation, scanned once per query
+        self.keyword_patterns = {
+            search_type: keyword_pattern(config['keywords'])
+            for search_type, config in self.search_types.items()
+        }
     
     def forward(self, query: str) -> Dict:
         """
@@ -110,26 +168,34 @@ It intelligently selects search types, optimizes queries, and provides comprehen
             Dictionary with location data including coordinates and administrative details
         """
         try:
-            print(f"🧠 Intelligent location search: '{query}'")
+            log.info("🧠 Intelligent location search: '%s'", query)
+            
+            location_key = cache_key(" ".join(query.lower().split()))
+            cached = _location_cache.get(location_key)
+            if cached is not None:
+                log.info("⚡ Cached location: %s", cached.get('name', 'Unknown'))
+                return cached
             
             # Intelligent search type selection
             search_types = self._determine_search_types(query)
-            print(f"🎯 Selected search types: {search_types}")
+            log.info("🎯 Selected search types: %s", search_types)
             
             # Execute optimized search
             result = self._execute_search(query, search_types)
             
-            if result.get('error'):
-                # Try fallback search with broader types
-                print("🔄 Trying fallback search...")
-                fallback_types = "adres,woonplaats,gemeente,weg"
-                result = self._execute_search(query, fallback_types)
+            # The broad search only runs on a miss, and not when it would
+            # repeat the targeted one
+            if result.get('error') and search_types != FALLBACK_SEARCH_TYPES:
+                log.info("🔄 Trying fallback search...")
+                result = self._execute_search(query, FALLBACK_SEARCH_TYPES)
             
+            if not result.get('error'):
+                _location_cache.set(location_key, result)
             return result
             
         except Exception as e:
             error_msg = f"Location search error: {str(e)}"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
             return {"error": error_msg}
     
     def _determine_search_types(self, query: str) -> str:
@@ -142,37 +208,28 @@ It intelligently selects search types, optimizes queries, and provides comprehen
         for search_type, config in self.search_types.items():
             score = config['priority']  # Base priority score
             
-            # Keyword matching
-            for keyword in config['keywords']:
-                if keyword in query_lower:
-                    score += 20
+            # Keyword matching: 20 points per distinct keyword found
+            score += 20 * len(set(self.keyword_patterns[search_type].findall(query_lower)))
             
             # Pattern-based scoring
             if search_type == 'adres':
                 # Look for address patterns (numbers, common address words)
-                if re.search(r'\d+', query) or any(word in query_lower for word in ['nummer', 'huisnummer', 'address']):
+                if DIGITS_RE.search(query) or ADDRESS_WORD_RE.search(query_lower):
                     score += 15
                     
             elif search_type == 'postcode':
                 # Dutch postcode pattern (4 digits + 2 letters)
-                if re.search(r'\d{4}\s*[a-zA-Z]{2}', query):
+                if POSTCODE_RE.search(query):
                     score += 30
                     
             elif search_type == 'gemeente':
                 # Common Dutch city indicators
-                if any(word in query_lower for word in [
-                    'amsterdam', 'rotterdam', 'utrecht', 'groningen', 'eindhoven',
-                    'tilburg', 'almere', 'breda', 'nijmegen', 'enschede', 'haarlem',
-                    'arnhem', 'zaanstad', 'haarlemmermeer', 'zoetermeer', 'emmen'
-                ]):
+                if CITY_RE.search(query_lower):
                     score += 25
                     
             elif search_type == 'weg':
                 # Street/road indicators
-                if any(word in query_lower for word in [
-                    'straat', 'laan', 'weg', 'plein', 'kade', 'gracht',
-                    'avenue', 'street', 'road', 'boulevard'
-                ]):
+                if STREET_RE.search(query_lower):
                     score += 20
             
             type_scores[search_type] = score
@@ -209,9 +266,9 @@ It intelligently selects search types, optimizes queries, and provides comprehen
                 'sort': 'score desc'
             }
             
-            print(f"🌐 PDOK API request: {optimized_query} | types: {search_types}")
+            log.info("🌐 PDOK API request: %s | types: %s", optimized_query, search_types)
             
-            response = requests.get(
+            response = pdok_get(
                 self.free_endpoint,
                 params=params,
                 headers={"User-Agent": self.user_agent},
@@ -219,13 +276,13 @@ It intelligently selects search types, optimizes queries, and provides comprehen
             )
             response.raise_for_status()
             
-            data = response.json()
+            data = response_json(response)
             docs = data.get('response', {}).get('docs', [])
             
             if not docs:
                 return {"error": f"No results found for '{query}' with types {search_types}"}
             
-            print(f"📦 PDOK returned {len(docs)} results")
+            log.info("📦 PDOK returned %s results", len(docs))
             
             # Select best result
             best_result = self._select_best_result(docs, query)
@@ -236,8 +293,8 @@ It intelligently selects search types, optimizes queries, and provides comprehen
             # Extract comprehensive location data
             location_data = self._extract_location_data(best_result, query)
             
-            print(f"✅ Selected: {location_data.get('name', 'Unknown')}")
-            print(f"📍 Coordinates: {location_data.get('lat', 0):.6f}, {location_data.get('lon', 0):.6f}")
+            log.info("✅ Selected: %s", location_data.get('name', 'Unknown'))
+            log.info("📍 Coordinates: %.6f, %.6f", location_data.get('lat', 0), location_data.get('lon', 0))
             
             return location_data
             
@@ -249,16 +306,11 @@ It intelligently selects search types, optimizes queries, and provides comprehen
     def _optimize_query(self, query: str) -> str:
         """Optimize the search query for better PDOK results."""
         # Remove common stop words that don't help with location search
-        stop_words = ['the', 'de', 'het', 'een', 'a', 'an', 'near', 'close to', 'around']
-        
-        words = query.split()
-        optimized_words = [word for word in words if word.lower() not in stop_words]
-        optimized = ' '.join(optimized_words).strip()
+        optimized = ' '.join(word for word in query.split() if word.lower() not in STOP_WORDS)
         
         # Handle common location patterns
-        optimized = optimized.replace('train station', 'station')
-        optimized = optimized.replace('city center', 'centrum')
-        optimized = optimized.replace('central station', 'centraal')
+        for phrase, replacement in QUERY_REPLACEMENTS:
+            optimized = optimized.replace(phrase, replacement)
         
         return optimized or query
     
@@ -268,36 +320,20 @@ It intelligently selects search types, optimizes queries, and provides comprehen
             return None
         
         query_lower = original_query.lower()
+        query_words = [word for word in query_lower.split() if len(word) >= 2]
         scored_results = []
         
         for doc in docs:
             score = 0
             
-            # Extract key fields
-            doc_type = doc.get('type', '').lower()
-            weergavenaam = doc.get('weergavenaam', '').lower()
-            straatnaam = doc.get('straatnaam', '').lower()
-            woonplaatsnaam = doc.get('woonplaatsnaam', '').lower()
-            gemeentenaam = doc.get('gemeentenaam', '').lower()
-            
             # Type-based scoring
-            type_scores = {
-                'adres': 35,      # Most specific
-                'postcode': 30,   # Very specific
-                'woonplaats': 25, # Good specificity
-                'gemeente': 20,   # Moderate specificity
-                'weg': 15         # Less specific
-            }
-            score += type_scores.get(doc_type, 5)
+            score += DOC_TYPE_SCORES.get(doc.get('type', '').lower(), DEFAULT_DOC_TYPE_SCORE)
             
-            # Text matching
-            query_words = query_lower.split()
-            for word in query_words:
-                if len(word) >= 2:
-                    if word in weergavenaam: score += 25
-                    if word in straatnaam: score += 20
-                    if word in woonplaatsnaam: score += 15
-                    if word in gemeentenaam: score += 12
+            # Text matching: each field is lowercased once, not once per query word
+            for field, weight in TEXT_MATCH_WEIGHTS:
+                value = doc.get(field, '').lower()
+                if value:
+                    score += weight * sum(word in value for word in query_words)
             
             # Quality indicators
             if doc.get('centroide_ll'): score += 15
@@ -313,9 +349,9 @@ It intelligently selects search types, optimizes queries, and provides comprehen
         # Sort by score
         scored_results.sort(key=lambda x: x[0], reverse=True)
         
-        print(f"🏆 Top results:")
+        log.debug("🏆 Top results:")
         for i, (score, result) in enumerate(scored_results[:3]):
-            print(f"  {i+1}. Score: {score:.1f} - {result.get('weergavenaam', 'Unknown')}")
+            log.debug("  %s. Score: %.1f - %s", i + 1, score, result.get('weergavenaam', 'Unknown'))
         
         return scored_results[0][1] if scored_results else None
     
@@ -385,7 +421,7 @@ It intelligently selects search types, optimizes queries, and provides comprehen
             }
             
         except Exception as e:
-            print(f"❌ Error extracting location data: {e}")
+            log.error("❌ Error extracting location data: %s", e)
             return {
                 "name": original_query,
                 "lat": 0.0,
@@ -468,7 +504,7 @@ accurate results for street addresses with house numbers.
     
     def __init__(self):
         super().__init__()
-        self.location_tool = IntelligentLocationSearchTool()
+        self.location_tool = _shared_tool(IntelligentLocationSearchTool)
     
     def forward(self, address_query: str) -> Dict:
         """
@@ -481,7 +517,7 @@ accurate results for street addresses with house numbers.
             Dictionary with detailed address information and precise coordinates
         """
         try:
-            print(f"🏠 Specialized address search: '{address_query}'")
+            log.info("🏠 Specialized address search: '%s'", address_query)
             
             # Use the location tool with address-specific optimization
             result = self.location_tool.forward(address_query)
@@ -495,33 +531,40 @@ accurate results for street addresses with house numbers.
                     result['address_verified'] = False
                     result['precision_level'] = result.get('precision', 'unknown')
                 
-                print(f"✅ Found address: {result.get('name')}")
+                log.info("✅ Found address: %s", result.get('name'))
                 return result
             else:
                 return {"error": f"No address found for '{address_query}': {result.get('error')}"}
                 
         except Exception as e:
             error_msg = f"Address search error: {str(e)}"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
             return {"error": error_msg}
 
 
+# The tools keep no per-call state, so the wrappers share one instance per class
+_shared_tools = {}
+
+def _shared_tool(tool_class):
+    tool = _shared_tools.get(tool_class)
+    if tool is None:
+        tool = _shared_tools[tool_class] = tool_class()
+    return tool
+
 # Export functions for backward compatibility
 def find_location_coordinates(query: str) -> dict:
     """Wrapper function for the IntelligentLocationSearchTool."""
-    tool = IntelligentLocationSearchTool()
-    return tool.forward(query)
+    return _shared_tool(IntelligentLocationSearchTool).forward(query)
 
 def search_dutch_address_pdok(address_query: str) -> dict:
     """Wrapper function for the SpecializedAddressSearchTool.""" 
-    tool = SpecializedAddressSearchTool()
-    return tool.forward(address_query)
+    return _shared_tool(SpecializedAddressSearchTool).forward(address_query)
 
 # Test function
 def test_intelligent_location_tools():
     """Test the intelligent location tools with various queries."""
-    location_tool = IntelligentLocationSearchTool()
-    address_tool = SpecializedAddressSearchTool()
+    location_tool = _shared_tool(IntelligentLocationSearchTool)
+    address_tool = _shared_tool(SpecializedAddressSearchTool)
     
     test_queries = [
         ("Amsterdam", "location"),
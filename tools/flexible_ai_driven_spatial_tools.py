@@ -1,10 +1,67 @@
 import requests
 import json
+import logging
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from smolagents import Tool
 import math
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union, Tuple
+from tools.spatial_kernels import (
+    ring_centroid_area, rings_centroid_area, as_ring_array, ERA_BREAKS, ERA_LABELS,
+    WGS84_TO_RD, RD_TO_WGS84, PYPROJ_AVAILABLE
+)
+from tools.pdok_http import (
+    pdok_get, response_json, iter_features, decode_flatgeobuf,
+    IJSON_AVAILABLE, FLATGEOBUF_AVAILABLE, FLATGEOBUF_FORMATS
+)
+from tools.result_cache import ResultCache, cache_key, open_disk_cache
+
+log = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+# Identical fetches within five minutes are served from memory, and within
+# an hour from disk when RESULT_CACHE_DIR is set
+WFS_CACHE_TTL = 300
+WFS_DISK_CACHE_TTL = 3600
+_wfs_result_cache = ResultCache(
+    maxsize=128, ttl=WFS_CACHE_TTL,
+    disk=open_disk_cache("wfs_results", WFS_DISK_CACHE_TTL)
+)
+
+# Construction-era CQL filters for server-side counts: (label, filter)
+_era_bounds = (None, *ERA_BREAKS, None)
+ERA_CQL_FILTERS = tuple(
+    (label, " AND ".join(
+        ([f"bouwjaar >= {lo}"] if lo is not None else []) + ([f"bouwjaar < {hi}"] if hi is not None else [])
+    ))
+    for label, lo, hi in zip(ERA_LABELS, _era_bounds, _era_bounds[1:])
+)
+
+# Runs the resultType=hits count requests of a stats-only fetch in parallel
+_hits_executor = ThreadPoolExecutor(max_workers=len(ERA_CQL_FILTERS) + 1, thread_name_prefix="pdok-hits")
+
+# Large fetches are split into WFS pages (startIndex/count) downloaded in
+# parallel; the host limiter in pdok_http still caps concurrency per host.
+# WFS only guarantees a stable order across requests with sortBy, so pages
+# are sorted on the first of these identifier properties the layer has.
+WFS_PAGE_SIZE = 1000
+WFS_SORT_KEY_CANDIDATES = ("identificatie", "lokaalid", "gml_id", "fid", "id", "objectid")
+MAX_PARALLEL_PAGES = 6
+_page_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_PAGES, thread_name_prefix="pdok-pages")
+
+# GetFeature output formats advertised by each service, looked up once a day
+OUTPUT_FORMAT_CACHE_TTL = 86400
+_output_format_cache = ResultCache(
+    maxsize=64, ttl=OUTPUT_FORMAT_CACHE_TTL,
+    disk=open_disk_cache("output_formats", OUTPUT_FORMAT_CACHE_TTL)
+)
 
 class FlexibleSpatialDataTool(Tool):
     """
@@ -20,59 +77,67 @@ class FlexibleSpatialDataTool(Tool):
     - Improved coordinate system handling
     - Building-specific optimizations with correct attribute mapping
     - Detailed logging for debugging filter and location issues
+    - stats_only=True returns only feature counts (per construction era for
+      buildings), counted by the server without downloading any geometry
     """
     
     inputs = {
         "service_url": {"type": "string", "description": "PDOK WFS service URL"},
         "layer_name": {"type": "string", "description": "Layer name to query"},
-        "search_area": {"type": "object", "description": "Search area with center point and radius", "nullable": True},
+        "search_area": {"type": "object", "description": "Search area with center point ([lat, lon], or RD New [x, y]) and radius", "nullable": True},
         "filters": {"type": "object", "description": "CQL or attribute filters", "nullable": True},
         "max_features": {"type": "integer", "description": "Maximum features to return", "nullable": True},
         "purpose": {"type": "string", "description": "Data usage purpose", "nullable": True},
-        "strict_containment": {"type": "boolean", "description": "Ensure features are within radius (default: True)", "nullable": True}
+        "strict_containment": {"type": "boolean", "description": "Ensure features are within radius (default: True)", "nullable": True},
+        "stats_only": {"type": "boolean", "description": "Only count matching features (per construction era for buildings), without fetching them", "nullable": True}
     }
     output_type = "object"
     is_initialized = True
     
     def __init__(self):
         super().__init__()
-        try:
-            import pyproj
-            self.transformer_to_rd = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:28992", always_xy=True)
-            self.transformer_to_wgs84 = pyproj.Transformer.from_crs("EPSG:28992", "EPSG:4326", always_xy=True)
-            self.pyproj_available = True
-            print("✅ FIXED FlexibleSpatialDataTool initialized with coordinate transformers")
-        except ImportError:
-            self.transformer_to_rd = None
-            self.transformer_to_wgs84 = None
-            self.pyproj_available = False
-            print("⚠️ PyProj not available - coordinate transformation limited")
+        self.transformer_to_rd = WGS84_TO_RD
+        self.transformer_to_wgs84 = RD_TO_WGS84
+        self.pyproj_available = PYPROJ_AVAILABLE
+        if PYPROJ_AVAILABLE:
+            log.info("✅ FIXED FlexibleSpatialDataTool initialized with coordinate transformers")
+        else:
+            log.warning("⚠️ PyProj not available - coordinate transformation limited")
     
     def forward(self, service_url: str, layer_name: str, search_area: Optional[Union[Dict, str]] = None, 
                 filters: Optional[Union[Dict, str]] = None, max_features: Optional[int] = 100,
-                purpose: Optional[str] = None, strict_containment: bool = True) -> Dict:
+                purpose: Optional[str] = None, strict_containment: bool = True,
+                stats_only: Optional[bool] = False) -> Dict:
         try:
-            print(f"🌐 FIXED Flexible PDOK data fetch")
-            print(f"   Service: {service_url}")
-            print(f"   Layer: {layer_name}")
-            print(f"   Purpose: {purpose}")
-            print(f"   Strict Containment: {strict_containment}")
-            print(f"   Filters: {filters}")
+            log.info("🌐 FIXED Flexible PDOK data fetch")
+            log.debug("   Service: %s", service_url)
+            log.debug("   Layer: %s", layer_name)
+            log.debug("   Purpose: %s", purpose)
+            log.debug("   Strict Containment: %s", strict_containment)
+            log.debug("   Filters: %s", filters)
+            
+            # Key on the arguments as given, before search_area is adjusted below
+            result_key = cache_key(service_url, layer_name, search_area, filters, max_features, purpose,
+                                   strict_containment, bool(stats_only))
+            cached = _wfs_result_cache.get(result_key)
+            if cached is not None:
+                log.info("⚡ Cached result: %s features", cached.get('count', 0))
+                return cached
             
             is_building_request = 'bag' in service_url or 'pand' in layer_name.lower()
             if is_building_request:
-                print(f"🏠 FIXED: Building request detected - applying building-specific optimizations")
+                log.info("🏠 FIXED: Building request detected - applying building-specific optimizations")
                 if search_area and isinstance(search_area, dict) and 'radius_km' in search_area:
                     original_radius = search_area['radius_km']
                     if original_radius > 3.0:
                         search_area['radius_km'] = 1.0
-                        print(f"🔧 FIXED: Reduced search radius from {original_radius}km to {search_area['radius_km']}km")
+                        log.info("🔧 FIXED: Reduced search radius from %skm to %skm", original_radius, search_area['radius_km'])
                 elif search_area and isinstance(search_area, dict):
                     search_area['radius_km'] = 1.0
-                    print(f"🔧 FIXED: Set default building search radius to 1km")
+                    log.info("🔧 FIXED: Set default building search radius to 1km")
             
             srs = self._determine_coordinate_system_fixed(service_url)
-            print(f"   🗺️ FIXED: Using coordinate system: {srs}")
+            log.debug("   🗺️ FIXED: Using coordinate system: %s", srs)
             
             params = {
                 'service': 'WFS',
@@ -84,53 +149,63 @@ class FlexibleSpatialDataTool(Tool):
                 'count': max_features or 100
             }
             
+            # Resolve the search center once; the bbox and containment filter share it
+            center_info = None
+            if isinstance(search_area, dict) and 'center' in search_area:
+                center_info = self._resolve_search_center(search_area, srs)
+            
             radius_km = None
             if search_area:
-                bbox, radius_km = self._process_search_area_fixed(search_area, srs)
+                bbox, radius_km = self._process_search_area_fixed(search_area, srs, center_info)
                 if bbox:
                     params['bbox'] = f"{bbox},{srs}"
-                    print(f"   ✅ FIXED Search area processed: {bbox}")
+                    log.debug("   ✅ FIXED Search area processed: %s", bbox)
                 else:
-                    print("   ⚠️ Could not process search area - proceeding without bbox")
+                    log.warning("   ⚠️ Could not process search area - proceeding without bbox")
             
             cql_filters = []
-            if strict_containment and search_area and isinstance(search_area, dict) and 'center' in search_area:
-                cql_filter = self._build_containment_cql_filter(search_area, srs)
+            if strict_containment and center_info:
+                cql_filter = self._build_containment_cql_filter(center_info, srs)
                 if cql_filter:
                     cql_filters.append(cql_filter)
-                    print(f"   ✅ FIXED Added containment CQL filter: {cql_filter}")
+                    log.debug("   ✅ FIXED Added containment CQL filter: %s", cql_filter)
             
             if filters:
                 user_cql_filter = self._build_cql_filter_fixed(filters, is_building_request)
                 if user_cql_filter:
                     cql_filters.append(user_cql_filter)
-                    print(f"   ✅ FIXED User CQL filter applied: {user_cql_filter}")
+                    log.debug("   ✅ FIXED User CQL filter applied: %s", user_cql_filter)
             
             if cql_filters:
                 params['cql_filter'] = " AND ".join(cql_filters)
             
-            print(f"🚀 FIXED Executing WFS request with params: {params}")
+            if stats_only:
+                result = self._count_features(service_url, params, is_building_request)
+                if result.get('success'):
+                    _wfs_result_cache.set(result_key, result)
+                return result
             
-            response = requests.get(service_url, params=params, timeout=30)
+            page_plan = self._page_plan(service_url, params) if params['count'] > WFS_PAGE_SIZE else None
             
-            print(f"📡 Response status: {response.status_code}")
-            print(f"📏 Response size: {len(response.content)} bytes")
+            # Binary FlatGeobuf skips JSON tokenizing when the service offers it
+            flatgeobuf_format = self._flatgeobuf_output_format(service_url)
+            features = None
+            if flatgeobuf_format:
+                features, error = self._fetch_pages(
+                    self._fetch_flatgeobuf_features, service_url, {**params, 'outputFormat': flatgeobuf_format}, page_plan
+                )
+                if error:
+                    return {'error': error, 'features': [], 'success': False}
             
-            if response.status_code != 200:
-                print(f"❌ HTTP Error: {response.status_code}")
-                return {
-                    'error': f'HTTP {response.status_code}: {response.text[:200]}',
-                    'features': [],
-                    'success': False
-                }
-            
-            data = response.json()
-            features = data.get('features', [])
+            if features is None:
+                features, error = self._fetch_pages(self._fetch_json_features, service_url, params, page_plan)
+                if error:
+                    return {'error': error, 'features': [], 'success': False}
             
-            print(f"📦 Received {len(features)} raw features")
+            log.info("📦 Received %s raw features", len(features))
             
             if len(features) == 0:
-                print("⚠️ FIXED: No features returned")
+                log.warning("⚠️ FIXED: No features returned")
                 return {
                     'features': [],
                     'count': 0,
@@ -139,30 +214,42 @@ class FlexibleSpatialDataTool(Tool):
                 }
             
             processed_features = []
-            search_center = None
+            search_center = [center_info['lat'], center_info['lon']] if center_info else None
             
-            if search_area and isinstance(search_area, dict) and 'center' in search_area:
-                search_center = search_area['center']
+            polygon_stats = self._batch_polygon_stats(features)
+            reproject = srs == "EPSG:28992" and self.transformer_to_wgs84 is not None
+            centers_wgs84 = self._batch_reproject_points(
+                {i: st[:2] for i, st in polygon_stats.items()}
+            ) if reproject else {}
             
             for i, feature in enumerate(features):
                 try:
+                    # Geometries of accepted features are reprojected together below
                     processed = self._process_feature_fixed(
-                        feature, srs, purpose, search_center, is_building_request, radius_km, strict_containment
+                        feature, srs, purpose, search_center, is_building_request, radius_km, strict_containment,
+                        polygon_stats.get(i), centers_wgs84.get(i), convert_geometry=False
                     )
                     if processed:
                         processed_features.append(processed)
                 except Exception as e:
-                    print(f"❌ Error processing feature {i+1}: {e}")
+                    log.error("❌ Error processing feature %s: %s", i + 1, e)
                     continue
             
-            print(f"✅ FIXED Processed {len(processed_features)} valid features")
+            if reproject and processed_features:
+                geometries = self._batch_convert_geometries_to_wgs84(
+                    [f['geometry'] for f in processed_features]
+                )
+                for processed, geometry in zip(processed_features, geometries):
+                    processed['geometry'] = geometry
+            
+            log.info("✅ FIXED Processed %s valid features", len(processed_features))
             
             legend_data = None
             if is_building_request and processed_features:
                 legend_data = self._generate_building_legend(processed_features)
-                print(f"🏷️ FIXED: Generated building legend with {len(legend_data.get('categories', []))} categories")
+                log.info("🏷️ FIXED: Generated building legend with %s categories", len(legend_data.get('categories', [])))
             
-            return {
+            result = {
                 "features": processed_features,
                 "count": len(processed_features),
                 "service": service_url,
@@ -173,16 +260,202 @@ class FlexibleSpatialDataTool(Tool):
                 "legend_data": legend_data,
                 "is_building_data": is_building_request
             }
+            _wfs_result_cache.set(result_key, result)
+            return result
             
         except Exception as e:
             error_msg = f"FIXED Flexible PDOK fetch failed: {str(e)}"
-            print(f"❌ {error_msg}")
+            log.error("❌ %s", error_msg)
             return {
                 "error": error_msg,
                 "success": False,
                 "features": []
             }
     
+    def _count_features(self, service_url: str, params: Dict, is_building: bool) -> Dict:
+        """
+        Count matching features with resultType=hits requests instead of fetching them.
+        For buildings, one count per construction era runs in parallel with the total.
+        """
+        count_params = {k: v for k, v in params.items() if k not in ('count', 'outputFormat')}
+        count_params['resultType'] = 'hits'
+        base_filter = count_params.pop('cql_filter', None)
+        
+        filters = {"total": base_filter}
+        if is_building:
+            for label, era_filter in ERA_CQL_FILTERS:
+                filters[label] = f"({base_filter}) AND {era_filter}" if base_filter else era_filter
+        
+        log.info("🔢 Counting features with %s hits request(s)", len(filters))
+        futures = {
+            label: _hits_executor.submit(self._number_matched, service_url, {**count_params, 'cql_filter': cql} if cql else count_params)
+            for label, cql in filters.items()
+        }
+        counts = {label: future.result() for label, future in futures.items()}
+        
+        total = counts.pop("total")
+        if total is None:
+            return {'error': 'Feature count request failed', 'features': [], 'success': False}
+        
+        result = {
+            "features": [],
+            "count": total,
+            "service": service_url,
+            "layer": params.get('typeName'),
+            "coordinate_system": params.get('srsName'),
+            "stats_only": True,
+            "success": True
+        }
+        if is_building:
+            result["era_distribution"] = counts
+            known = sum(n for n in counts.values() if n is not None)
+            result["era_distribution"]["Unknown Age"] = max(total - known, 0)
+        log.info("✅ Counted %s features", total)
+        return result
+    
+    def _number_matched(self, service_url: str, params: Dict) -> Optional[int]:
+        """numberMatched from a resultType=hits GetFeature response, or None on failure."""
+        try:
+            response = pdok_get(service_url, params=params, timeout=30)
+            response.raise_for_status()
+            return int(ET.fromstring(response.content).get('numberMatched'))
+        except Exception as e:
+            log.warning("⚠️ Count request failed: %s", e)
+            return None
+    
+    def _page_plan(self, service_url: str, params: Dict) -> Optional[Tuple[int, str]]:
+        """
+        (features to fetch, sortBy property) for a paged fetch, or None when
+        one request should be made instead. The numberMatched count and a
+        one-feature sample (for the layer's identifier property) are fetched
+        in parallel.
+        """
+        count_params = {k: v for k, v in params.items() if k not in ('count', 'outputFormat')}
+        matched = _hits_executor.submit(self._number_matched, service_url, {**count_params, 'resultType': 'hits'})
+        try:
+            sample, error = self._fetch_json_features(service_url, {**params, 'count': 1})
+        except Exception as e:
+            sample, error = None, str(e)
+        number_matched = matched.result()
+        if number_matched is None or error or not sample:
+            return None
+        
+        total = min(params['count'], number_matched)
+        if total <= WFS_PAGE_SIZE:
+            return None
+        properties = {name.lower(): name for name in (sample[0].get('properties') or {})}
+        sort_key = next((properties[c] for c in WFS_SORT_KEY_CANDIDATES if c in properties), None)
+        if sort_key is None:
+            log.info("📑 No identifier property to sort pages on, fetching in one request")
+            return None
+        return total, sort_key
+    
+    def _fetch_pages(self, fetch_page, service_url: str, params: Dict,
+                     page_plan: Optional[Tuple[int, str]] = None) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """
+        Run fetch_page once, or with a page plan from _page_plan once per
+        WFS_PAGE_SIZE page in parallel, every page sorted on the same key;
+        pages are concatenated in order and the first error (or undecodable
+        page) fails the whole fetch and cancels the pages not yet started.
+        """
+        if page_plan is None:
+            return fetch_page(service_url, params)
+        
+        total, sort_key = page_plan
+        starts = range(0, total, WFS_PAGE_SIZE)
+        log.info("📑 Fetching %s features as %s parallel pages sorted by %s", total, len(starts), sort_key)
+        futures = [
+            _page_executor.submit(fetch_page, service_url,
+                                  {**params, 'sortBy': sort_key, 'startIndex': start,
+                                   'count': min(WFS_PAGE_SIZE, total - start)})
+            for start in starts
+        ]
+        
+        features = []
+        for k, future in enumerate(futures):
+            page, error = future.result()
+            if error or page is None:
+                for pending in futures[k + 1:]:
+                    pending.cancel()
+                return page, error
+            features.extend(page)
+        return features, None
+    
+    def _fetch_json_features(self, service_url: str, params: Dict) -> Tuple[List[Dict], Optional[str]]:
+        """Run the GetFeature request as GeoJSON; returns (features, error message)."""
+        log.info("🚀 FIXED Executing WFS request with params: %s", params)
+        
+        # With ijson the FeatureCollection is parsed while it downloads
+        response = pdok_get(service_url, params=params, timeout=30, stream=IJSON_AVAILABLE)
+        
+        log.info("📡 Response status: %s", response.status_code)
+        if not IJSON_AVAILABLE:
+            log.info("📏 Response size: %s bytes", len(response.content))
+        
+        if response.status_code != 200:
+            log.error("❌ HTTP Error: %s", response.status_code)
+            message = f'HTTP {response.status_code}: {response.text[:200]}'
+            response.close()
+            return [], message
+        
+        if IJSON_AVAILABLE:
+            return list(iter_features(response, params['count'])), None
+        return response_json(response).get('features', []), None
+    
+    def _fetch_flatgeobuf_features(self, service_url: str, params: Dict) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Run the GetFeature request as FlatGeobuf; features are None when decoding fails."""
+        log.info("🚀 FIXED Executing WFS request with params: %s", params)
+        response = pdok_get(service_url, params=params, timeout=30)
+        
+        log.info("📡 Response status: %s", response.status_code)
+        log.info("📏 Response size: %s bytes", len(response.content))
+        
+        if response.status_code != 200:
+            log.error("❌ HTTP Error: %s", response.status_code)
+            return None, f'HTTP {response.status_code}: {response.text[:200]}'
+        
+        try:
+            return decode_flatgeobuf(response.content)[:params['count']], None
+        except Exception as e:
+            log.warning("⚠️ FlatGeobuf decoding failed, falling back to GeoJSON: %s", e)
+            return None, None
+    
+    def _flatgeobuf_output_format(self, service_url: str) -> Optional[str]:
+        """The FlatGeobuf outputFormat the service advertises, if it can be decoded here."""
+        if not FLATGEOBUF_AVAILABLE:
+            return None
+        key = cache_key(service_url)
+        formats = _output_format_cache.get(key)
+        if formats is None:
+            formats = self._get_output_formats(service_url)
+            if formats is None:
+                return None
+            _output_format_cache.set(key, formats)
+        return next((f for f in formats if f.split(';')[0].strip().lower() in FLATGEOBUF_FORMATS), None)
+    
+    def _get_output_formats(self, service_url: str) -> Optional[List[str]]:
+        """GetFeature outputFormat values from the service's GetCapabilities, or None on failure."""
+        try:
+            params = {
+                'service': 'WFS',
+                'version': '2.0.0',
+                'request': 'GetCapabilities'
+            }
+            response = pdok_get(service_url, params=params, timeout=15)
+            response.raise_for_status()
+            root = ET.fromstring(response.content)
+        except Exception as e:
+            log.warning("⚠️ Could not read output formats for %s: %s", service_url, e)
+            return None
+        
+        formats = []
+        for operation in root.iter():
+            if operation.tag.endswith('Operation') and operation.get('name') == 'GetFeature':
+                for parameter in operation.iter():
+                    if parameter.tag.endswith('Parameter') and parameter.get('name') == 'outputFormat':
+                        formats.extend(v.text.strip() for v in parameter.iter() if v.tag.endswith('Value') and v.text)
+        return formats
+    
     def _determine_coordinate_system_fixed(self, service_url: str) -> str:
         if "bag" in service_url:
             return "EPSG:28992"
@@ -197,102 +470,131 @@ class FlexibleSpatialDataTool(Tool):
         else:
             return "EPSG:4326"
     
-    def _process_search_area_fixed(self, search_area: Union[Dict, str], srs: str) -> Tuple[Optional[str], Optional[float]]:
+    def _looks_like_rd(self, coords) -> bool:
+        """RD New coordinates are metres; no valid lat/lon value exceeds 180."""
+        return abs(float(coords[0])) > 180 or abs(float(coords[1])) > 180
+    
+    def _resolve_search_center(self, search_area: Dict, srs: str) -> Optional[Dict]:
+        """
+        Validate the search center and resolve it in both WGS84 and, for RD
+        services, RD New. A center given as [lat, lon] is projected once; a
+        center already in RD ([x, y]) is used as-is.
+        """
         try:
-            print(f"🔍 FIXED Processing search area: {search_area}")
+            center = search_area['center']
+            radius_km = search_area.get('radius_km', 1.0)
             
-            if isinstance(search_area, dict) and 'center' in search_area:
-                center = search_area['center']
-                radius_km = search_area.get('radius_km', 1.0)
-                
-                if not isinstance(center, (list, tuple)) or len(center) != 2:
-                    print(f"   ❌ Invalid center format: {center}")
-                    return None, None
-                
+            if not isinstance(center, (list, tuple)) or len(center) != 2:
+                log.debug("   ❌ Invalid center format: %s", center)
+                return None
+            
+            rd_center = None
+            if self._looks_like_rd(center):
+                rd_center = (float(center[0]), float(center[1]))
+                if not self.transformer_to_wgs84:
+                    log.debug("   ❌ FIXED: RD center given but no transformer available: %s", center)
+                    return None
+                lon, lat = self.transformer_to_wgs84.transform(*rd_center)
+                log.debug("   ✅ FIXED: Center already in RD New: X=%.2f, Y=%.2f", rd_center[0], rd_center[1])
+            else:
                 lat, lon = float(center[0]), float(center[1])
-                
-                if not (50.5 <= lat <= 53.8 and 3.0 <= lon <= 7.5):
-                    print(f"   ❌ FIXED: Coordinates outside Netherlands bounds: {lat}, {lon}")
-                    return None, None
-                
-                print(f"   ✅ FIXED: Valid Netherlands coordinates: lat={lat}, lon={lon}, radius={radius_km}km")
-                
-                if srs == "EPSG:28992" and self.transformer_to_rd:
-                    center_x, center_y = self.transformer_to_rd.transform(lon, lat)
-                    print(f"   🔄 FIXED: Converted to RD New: X={center_x:.2f}, Y={center_y:.2f}")
-                    
-                    if not (10000 <= center_x <= 280000 and 300000 <= center_y <= 630000):
-                        print(f"   ❌ FIXED: RD coordinates out of bounds: {center_x}, {center_y}")
-                        return None, None
-                    
-                    radius_m = radius_km * 1000
-                    min_x = center_x - radius_m
-                    min_y = center_y - radius_m
-                    max_x = center_x + radius_m
-                    max_y = center_y + radius_m
-                    
-                    bbox = f"{min_x},{min_y},{max_x},{max_y}"
-                    print(f"   ✅ FIXED: RD New bbox: {bbox}")
-                    return bbox, radius_km
-                    
-                elif srs == "EPSG:4326":
-                    lat_rad = math.radians(lat)
-                    km_per_degree_lat = 111.0
-                    km_per_degree_lon = 111.0 * math.cos(lat_rad)
-                    
-                    lat_buffer = radius_km / km_per_degree_lat
-                    lon_buffer = radius_km / km_per_degree_lon
-                    
-                    min_lon = lon - lon_buffer
-                    min_lat = lat - lat_buffer
-                    max_lon = lon + lon_buffer
-                    max_lat = lat + lat_buffer
-                    
-                    bbox = f"{min_lon},{min_lat},{max_lon},{max_lat}"
-                    print(f"   ✅ FIXED: WGS84 bbox: {bbox}")
-                    return bbox, radius_km
+            
+            if not (50.5 <= lat <= 53.8 and 3.0 <= lon <= 7.5):
+                log.debug("   ❌ FIXED: Coordinates outside Netherlands bounds: %s, %s", lat, lon)
+                return None
+            
+            if srs == "EPSG:28992" and rd_center is None and self.transformer_to_rd:
+                rd_center = self.transformer_to_rd.transform(lon, lat)
+                log.debug("   🔄 FIXED: Converted to RD New: X=%.2f, Y=%.2f", rd_center[0], rd_center[1])
+            
+            if rd_center and not (10000 <= rd_center[0] <= 280000 and 300000 <= rd_center[1] <= 630000):
+                log.debug("   ❌ FIXED: RD coordinates out of bounds: %s, %s", rd_center[0], rd_center[1])
+                return None
+            
+            log.debug("   ✅ FIXED: Valid Netherlands coordinates: lat=%s, lon=%s, radius=%skm", lat, lon, radius_km)
+            return {
+                "lat": lat,
+                "lon": lon,
+                "rd": rd_center,
+                "radius_km": radius_km,
+                "radius_m": radius_km * 1000
+            }
+        except Exception as e:
+            log.debug("❌ FIXED Error resolving search center: %s", e)
+            return None
+    
+    def _process_search_area_fixed(self, search_area: Union[Dict, str], srs: str,
+                                   center_info: Optional[Dict] = None) -> Tuple[Optional[str], Optional[float]]:
+        try:
+            log.debug("🔍 FIXED Processing search area: %s", search_area)
+            
+            if isinstance(search_area, str):
+                # Explicit bbox: pass through when it is already in the service CRS
+                values = [float(v) for v in search_area.split(',')[:4]]
+                if len(values) == 4 and self._looks_like_rd(values) == (srs == "EPSG:28992"):
+                    bbox = ",".join(str(v) for v in values)
+                    log.debug("   ✅ FIXED: Using bbox as given: %s", bbox)
+                    return bbox, None
+                log.debug("   ⚠️ FIXED: bbox does not match %s: %s", srs, search_area)
+                return None, None
+            
+            if center_info is None and isinstance(search_area, dict) and 'center' in search_area:
+                center_info = self._resolve_search_center(search_area, srs)
+            if not center_info:
+                return None, None
+            
+            radius_km = center_info['radius_km']
+            
+            if srs == "EPSG:28992" and center_info['rd']:
+                center_x, center_y = center_info['rd']
+                radius_m = center_info['radius_m']
+                bbox = f"{center_x - radius_m},{center_y - radius_m},{center_x + radius_m},{center_y + radius_m}"
+                log.debug("   ✅ FIXED: RD New bbox: %s", bbox)
+                return bbox, radius_km
+            
+            elif srs == "EPSG:4326":
+                bbox = "{},{},{},{}".format(*self._wgs84_bounds(center_info))
+                log.debug("   ✅ FIXED: WGS84 bbox: %s", bbox)
+                return bbox, radius_km
             
             return None, None
             
         except Exception as e:
-            print(f"❌ FIXED Error processing search area: {e}")
+            log.debug("❌ FIXED Error processing search area: %s", e)
             return None, None
     
-    def _build_containment_cql_filter(self, search_area: Dict, srs: str) -> Optional[str]:
+    def _wgs84_bounds(self, center_info: Dict) -> Tuple[float, float, float, float]:
+        """(min_lon, min_lat, max_lon, max_lat) of the radius box around the center."""
+        lat, lon, radius_km = center_info['lat'], center_info['lon'], center_info['radius_km']
+        km_per_degree_lat = 111.0
+        km_per_degree_lon = 111.0 * math.cos(math.radians(lat))
+        lat_buffer = radius_km / km_per_degree_lat
+        lon_buffer = radius_km / km_per_degree_lon
+        return lon - lon_buffer, lat - lat_buffer, lon + lon_buffer, lat + lat_buffer
+    
+    def _build_containment_cql_filter(self, center_info: Dict, srs: str) -> Optional[str]:
         try:
-            center = search_area['center']
-            radius_km = search_area.get('radius_km', 1.0)
-            lat, lon = float(center[0]), float(center[1])
-            
-            if srs == "EPSG:28992" and self.transformer_to_rd:
-                center_x, center_y = self.transformer_to_rd.transform(lon, lat)
-                radius_m = radius_km * 1000
+            if srs == "EPSG:28992" and center_info['rd']:
+                center_x, center_y = center_info['rd']
+                radius_m = center_info['radius_m']
                 return f"WITHIN(the_geom, POLYGON(({center_x-radius_m} {center_y-radius_m}, {center_x-radius_m} {center_y+radius_m}, {center_x+radius_m} {center_y+radius_m}, {center_x+radius_m} {center_y-radius_m}, {center_x-radius_m} {center_y-radius_m})))"
             elif srs == "EPSG:4326":
-                lat_rad = math.radians(lat)
-                km_per_degree_lat = 111.0
-                km_per_degree_lon = 111.0 * math.cos(lat_rad)
-                lat_buffer = radius_km / km_per_degree_lat
-                lon_buffer = radius_km / km_per_degree_lon
-                min_lon = lon - lon_buffer
-                min_lat = lat - lat_buffer
-                max_lon = lon + lon_buffer
-                max_lat = lat + lat_buffer
+                min_lon, min_lat, max_lon, max_lat = self._wgs84_bounds(center_info)
                 return f"WITHIN(the_geom, POLYGON(({min_lon} {min_lat}, {min_lon} {max_lat}, {max_lon} {max_lat}, {max_lon} {min_lat}, {min_lon} {min_lat})))"
             return None
         except Exception as e:
-            print(f"❌ FIXED Error building containment CQL filter: {e}")
+            log.error("❌ FIXED Error building containment CQL filter: %s", e)
             return None
     
     def _build_cql_filter_fixed(self, filters: Union[Dict, str], is_building_request: bool) -> Optional[str]:
         """Build CQL filter with correct attribute mapping."""
         try:
-            print(f"🔍 FIXED Building CQL filter: {filters}")
+            log.debug("🔍 FIXED Building CQL filter: %s", filters)
             if isinstance(filters, str):
                 if filters.strip():
-                    print(f"   ✅ FIXED Using CQL string: {filters.strip()}")
+                    log.debug("   ✅ FIXED Using CQL string: %s", filters.strip())
                     return filters.strip()
-                print("   ❌ Empty CQL string")
+                log.debug("   ❌ Empty CQL string")
                 return None
             elif isinstance(filters, dict):
                 filter_parts = []
@@ -301,48 +603,57 @@ class FlexibleSpatialDataTool(Tool):
                         if isinstance(condition, dict):
                             if 'min_value' in condition:
                                 filter_parts.append(f"{attr} >= {condition['min_value']}")
-                                print(f"   ✅ FIXED Added filter: {attr} >= {condition['min_value']}")
+                                log.debug("   ✅ FIXED Added filter: %s >= %s", attr, condition['min_value'])
                             if 'max_value' in condition:
                                 filter_parts.append(f"{attr} <= {condition['max_value']}")
-                                print(f"   ✅ FIXED Added filter: {attr} <= {condition['max_value']}")
+                                log.debug("   ✅ FIXED Added filter: %s <= %s", attr, condition['max_value'])
                             if 'equals' in condition:
                                 value = f"'{condition['equals']}'" if isinstance(condition['equals'], str) else condition['equals']
                                 filter_parts.append(f"{attr} = {value}")
-                                print(f"   ✅ FIXED Added filter: {attr} = {value}")
+                                log.debug("   ✅ FIXED Added filter: %s = %s", attr, value)
                             if 'like' in condition:
                                 filter_parts.append(f"{attr} LIKE '%{condition['like']}%'")
-                                print(f"   ✅ FIXED Added filter: {attr} LIKE '%{condition['like']}%'")
+                                log.debug("   ✅ FIXED Added filter: %s LIKE '%%%s%%'", attr, condition['like'])
                         else:
                             value = f"'{condition}'" if isinstance(condition, str) else condition
                             filter_parts.append(f"{attr} = {value}")
-                            print(f"   ✅ FIXED Added filter: {attr} = {value}")
+                            log.debug("   ✅ FIXED Added filter: %s = %s", attr, value)
                 
                 return " AND ".join(filter_parts) if filter_parts else None
-            print("   ❌ Invalid filter format")
+            log.debug("   ❌ Invalid filter format")
             return None
         except Exception as e:
-            print(f"❌ FIXED Error building CQL filter: {e}")
+            log.debug("❌ FIXED Error building CQL filter: %s", e)
             return None
     
     def _process_feature_fixed(self, feature: Dict, srs: str, purpose: Optional[str], 
                              search_center: Optional[List[float]], is_building: bool,
-                             radius_km: Optional[float], strict_containment: bool) -> Optional[Dict]:
+                             radius_km: Optional[float], strict_containment: bool,
+                             precomputed_stats: Optional[Tuple[float, float, float]] = None,
+                             precomputed_center: Optional[Tuple[float, float]] = None,
+                             convert_geometry: bool = True) -> Optional[Dict]:
         try:
             properties = feature.get('properties', {})
             geometry = feature.get('geometry', {})
+            reproject = srs == "EPSG:28992" and self.transformer_to_wgs84
             
-            if srs == "EPSG:28992" and self.transformer_to_wgs84:
-                geometry = self._convert_geometry_to_wgs84_fixed(geometry)
-            
-            centroid = self._calculate_centroid_fixed(geometry)
-            if not centroid:
-                print(f"   ❌ Could not calculate centroid")
+            # Centroid and area come from the native geometry; only the centroid is
+            # reprojected until the feature has passed the location gates below.
+            stats = precomputed_stats or self._calculate_centroid_and_area(geometry)
+            if not stats:
+                log.debug("   ❌ Could not calculate centroid")
                 return None
             
-            lat, lon = centroid
+            center_x, center_y, area = stats
+            if reproject and precomputed_center:
+                lon, lat = precomputed_center
+            elif reproject:
+                lon, lat = self.transformer_to_wgs84.transform(center_x, center_y)
+            else:
+                lon, lat = center_x, center_y
             
             if not (50.5 <= lat <= 53.8 and 3.0 <= lon <= 7.5):
-                print(f"   ❌ FIXED: Centroid outside Netherlands: {lat:.6f}, {lon:.6f}")
+                log.debug("   ❌ FIXED: Centroid outside Netherlands: %.6f, %.6f", lat, lon)
                 return None
             
             if search_center and radius_km and strict_containment:
@@ -350,9 +661,12 @@ class FlexibleSpatialDataTool(Tool):
                 distance_km = self._calculate_distance(lat, lon, center_lat, center_lon)
                 
                 if distance_km > radius_km:
-                    print(f"   ❌ FIXED: Feature outside radius: {distance_km:.2f}km > {radius_km}km")
+                    log.debug("   ❌ FIXED: Feature outside radius: %.2fkm > %skm", distance_km, radius_km)
                     return None
-                print(f"   ✅ FIXED: Feature within radius: {distance_km:.2f}km <= {radius_km}km")
+                log.debug("   ✅ FIXED: Feature within radius: %.2fkm <= %skm", distance_km, radius_km)
+            
+            if reproject and convert_geometry:
+                geometry = self._convert_geometry_to_wgs84_fixed(geometry)
             
             if is_building:
                 feature_name = self._create_building_name(properties)
@@ -361,7 +675,7 @@ class FlexibleSpatialDataTool(Tool):
                 feature_name = self._create_feature_name(properties)
                 feature_description = self._create_feature_description(properties)
             
-            return {
+            processed = {
                 "type": "Feature",
                 "name": feature_name,
                 "properties": properties,
@@ -373,9 +687,12 @@ class FlexibleSpatialDataTool(Tool):
                 "description": feature_description,
                 "is_building": is_building
             }
+            if area is not None and srs == "EPSG:28992":
+                processed["area_m2"] = round(area, 1)
+            return processed
             
         except Exception as e:
-            print(f"❌ FIXED Error processing feature: {e}")
+            log.debug("❌ FIXED Error processing feature: %s", e)
             return None
     
     def _create_building_name(self, properties: Dict) -> str:
@@ -456,7 +773,7 @@ class FlexibleSpatialDataTool(Tool):
             }
             return legend_data
         except Exception as e:
-            print(f"❌ Error generating building legend: {e}")
+            log.error("❌ Error generating building legend: %s", e)
             return {"layer_type": "buildings", "title": "🏠 Buildings", "categories": []}
     
     def _convert_geometry_to_wgs84_fixed(self, geometry: Dict) -> Dict:
@@ -469,37 +786,117 @@ class FlexibleSpatialDataTool(Tool):
                     wgs84 = self.transformer_to_wgs84.transform(coords[0], coords[1])
                     return {'type': 'Point', 'coordinates': [wgs84[0], wgs84[1]]}
             elif geometry['type'] == 'Polygon':
+                # One PROJ call per ring on the whole coordinate array
                 wgs84_coords = []
                 for ring in geometry['coordinates']:
-                    wgs84_ring = []
-                    for coord in ring:
-                        if len(coord) >= 2:
-                            wgs84 = self.transformer_to_wgs84.transform(coord[0], coord[1])
-                            wgs84_ring.append([wgs84[0], wgs84[1]])
-                    wgs84_coords.append(wgs84_ring)
+                    arr = as_ring_array(ring)
+                    if arr is None:
+                        wgs84_coords.append([])
+                        continue
+                    if NUMPY_AVAILABLE:
+                        lons, lats = self.transformer_to_wgs84.transform(arr[:, 0], arr[:, 1])
+                        wgs84_coords.append(np.column_stack((lons, lats)).tolist())
+                    else:
+                        lons, lats = self.transformer_to_wgs84.transform([c[0] for c in arr], [c[1] for c in arr])
+                        wgs84_coords.append([[lon, lat] for lon, lat in zip(lons, lats)])
                 return {'type': 'Polygon', 'coordinates': wgs84_coords}
             return geometry
         except Exception as e:
-            print(f"❌ Error converting geometry: {e}")
+            log.debug("❌ Error converting geometry: %s", e)
             return geometry
     
-    def _calculate_centroid_fixed(self, geometry: Dict) -> Optional[Tuple[float, float]]:
+    def _batch_reproject_points(self, points: Dict[int, Tuple[float, float]]) -> Dict[int, Tuple[float, float]]:
+        """Reproject RD points to WGS84 (lon, lat) in one PROJ call, keyed like the input."""
+        if not points or not self.transformer_to_wgs84:
+            return {}
+        try:
+            keys = list(points)
+            xs = [points[k][0] for k in keys]
+            ys = [points[k][1] for k in keys]
+            if NUMPY_AVAILABLE:
+                xs, ys = np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+            lons, lats = self.transformer_to_wgs84.transform(xs, ys)
+            return {k: (float(lon), float(lat)) for k, lon, lat in zip(keys, lons, lats)}
+        except Exception as e:
+            log.warning("⚠️ Batch point reprojection failed, falling back to per-feature: %s", e)
+            return {}
+    
+    def _batch_convert_geometries_to_wgs84(self, geometries: List[Dict]) -> List[Dict]:
+        """
+        Reproject Point and Polygon geometries with a single PROJ call.
+        
+        All rings are concatenated into flat x/y arrays, transformed at once and
+        sliced back by offset. Other geometry types are returned unchanged.
+        """
+        if not geometries or not self.transformer_to_wgs84:
+            return geometries
+        try:
+            # (geometry index, ring index or None for a Point, vertex array)
+            parts = []
+            for gi, geometry in enumerate(geometries):
+                gtype = geometry.get('type')
+                coords = geometry.get('coordinates')
+                if gtype == 'Point' and coords and len(coords) >= 2:
+                    parts.append((gi, None, as_ring_array([coords])))
+                elif gtype == 'Polygon' and coords:
+                    for ri, ring in enumerate(coords):
+                        parts.append((gi, ri, as_ring_array(ring)))
+            
+            offsets = [0]
+            for _, _, arr in parts:
+                offsets.append(offsets[-1] + (len(arr) if arr is not None else 0))
+            if offsets[-1] == 0:
+                return geometries
+            
+            if NUMPY_AVAILABLE:
+                stacked = np.concatenate([arr for _, _, arr in parts if arr is not None])
+                lons, lats = self.transformer_to_wgs84.transform(stacked[:, 0], stacked[:, 1])
+                lonlat = np.column_stack((lons, lats)).tolist()
+            else:
+                xs = [c[0] for _, _, arr in parts if arr is not None for c in arr]
+                ys = [c[1] for _, _, arr in parts if arr is not None for c in arr]
+                lons, lats = self.transformer_to_wgs84.transform(xs, ys)
+                lonlat = [[lon, lat] for lon, lat in zip(lons, lats)]
+            
+            converted = list(geometries)
+            polygon_rings = {}
+            for (gi, ri, _), start, end in zip(parts, offsets, offsets[1:]):
+                if ri is None:
+                    converted[gi] = {'type': 'Point', 'coordinates': lonlat[start]}
+                else:
+                    polygon_rings.setdefault(gi, []).append(lonlat[start:end])
+            for gi, rings in polygon_rings.items():
+                converted[gi] = {'type': 'Polygon', 'coordinates': rings}
+            return converted
+        except Exception as e:
+            log.warning("⚠️ Batch geometry reprojection failed, falling back to per-feature: %s", e)
+            return [self._convert_geometry_to_wgs84_fixed(g) for g in geometries]
+    
+    def _batch_polygon_stats(self, features: List[Dict]) -> Dict[int, Tuple[float, float, float]]:
+        """Centroid and area for every Polygon feature in one batch, keyed by feature index."""
+        try:
+            indexed_rings = [
+                (i, f['geometry']['coordinates'][0]) for i, f in enumerate(features)
+                if (f.get('geometry') or {}).get('type') == 'Polygon' and f['geometry'].get('coordinates')
+            ]
+            stats = rings_centroid_area([ring for _, ring in indexed_rings])
+            return {i: st for (i, _), st in zip(indexed_rings, stats) if st}
+        except Exception as e:
+            log.warning("⚠️ Batch polygon stats failed, falling back to per-feature: %s", e)
+            return {}
+    
+    def _calculate_centroid_and_area(self, geometry: Dict) -> Optional[Tuple[float, float, Optional[float]]]:
+        """Return (x, y, area) in the geometry's own CRS; area is None for points."""
         try:
             if geometry['type'] == 'Point':
                 coords = geometry['coordinates']
                 if len(coords) >= 2:
-                    return coords[1], coords[0]
+                    return coords[0], coords[1], None
             elif geometry['type'] == 'Polygon':
-                coords = geometry['coordinates'][0]
-                if coords and len(coords) > 0:
-                    valid_coords = [c for c in coords if len(c) >= 2]
-                    if valid_coords:
-                        avg_x = sum(c[0] for c in valid_coords) / len(valid_coords)
-                        avg_y = sum(c[1] for c in valid_coords) / len(valid_coords)
-                        return avg_y, avg_x
+                return ring_centroid_area(geometry['coordinates'][0])
             return None
         except Exception as e:
-            print(f"❌ Error calculating centroid: {e}")
+            log.debug("❌ Error calculating centroid: %s", e)
             return None
     
     def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -557,14 +954,14 @@ The AI determines what analysis operations to perform based on the user's query.
                 reference_point: Optional[Dict] = None, 
                 output_requirements: Optional[Dict] = None) -> Dict:
         try:
-            print(f"🧮 Flexible spatial analysis")
-            print(f"   Datasets: {list(datasets.keys())}")
-            print(f"   Operations: {list(analysis_operations.keys())}")
+            log.info("🧮 Flexible spatial analysis")
+            log.debug("   Datasets: %s", list(datasets.keys()))
+            log.debug("   Operations: %s", list(analysis_operations.keys()))
             
             results = {}
             
             for operation_name, operation_config in analysis_operations.items():
-                print(f"   🔄 Performing {operation_name}")
+                log.debug("   🔄 Performing %s", operation_name)
                 
                 if operation_name == "proximity_analysis":
                     results[operation_name] = self._proximity_analysis(
@@ -0,0 +1,316 @@
+# tools/pdok_http.py - Throttled HTTP access to PDOK services
+
+"""
+Shared HTTP helper for the PDOK tools.
+
+Every request goes through a per-host limiter: a semaphore caps the
+number of requests in flight and a token bucket caps the request rate,
+so parallel fetching stays within what the services accept. Responses
+with 429/503 are retried with exponential backoff, honouring Retry-After.
+JSON bodies are decoded with orjson when it is installed; with ijson,
+GeoJSON features can be parsed straight off the socket instead, and with
+pyogrio and Shapely 2.x binary FlatGeobuf responses can be decoded. All requests
+share one pooled Session, so TCP/TLS connections are kept alive and reused;
+a request that hits a dropped connection is retried on a fresh one.
+"""
+
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from itertools import islice
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    ijson = None
+    IJSON_AVAILABLE = False
+
+try:
+    import pyogrio.raw
+    import shapely
+    FLATGEOBUF_AVAILABLE = hasattr(shapely, "to_geojson")
+except ImportError:
+    FLATGEOBUF_AVAILABLE = False
+
+# outputFormat values under which WFS servers advertise FlatGeobuf
+FLATGEOBUF_FORMATS = ("application/flatgeobuf", "flatgeobuf")
+
+# host -> (max concurrent requests, requests per second)
+HOST_LIMITS = {
+    "api.pdok.nl": (4, 5.0),
+    "service.pdok.nl": (8, 10.0),
+}
+DEFAULT_HOST_LIMIT = (4, 5.0)
+
+# One pool per known host, each large enough for that host's concurrency
+# limit, so every in-flight request reuses a kept-alive connection
+POOL_CONNECTIONS = max(len(HOST_LIMITS), 1) + 1
+POOL_MAXSIZE = max(limit for limit, _ in list(HOST_LIMITS.values()) + [DEFAULT_HOST_LIMIT])
+
+# Connection-level failures (refused, reset, or a kept-alive connection the
+# server already closed) are retried by urllib3 itself; throttling statuses
+# are handled separately by pdok_get
+CONNECTION_RETRIES = Retry(total=2, connect=2, read=1, status=0, backoff_factor=0.2,
+                           allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False)
+
+RETRY_STATUS_CODES = (429, 503)
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 10.0
+
+# Hosts whose connections are opened ahead of the first tool call
+WARMUP_URLS = ("https://api.pdok.nl/", "https://service.pdok.nl/")
+WARMUP_INTERVAL_SECONDS = 30.0
+WARMUP_TIMEOUT_SECONDS = 5.0
+
+
+class HostLimiter:
+    """Concurrency semaphore plus token-bucket rate limit for one host."""
+
+    def __init__(self, max_concurrent: int, rate_per_second: float):
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.rate = rate_per_second
+        self.capacity = max(1.0, rate_per_second)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait_for_token(self):
+        """Block until the bucket has a token, then take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def acquire(self):
+        """Take a concurrency slot and a rate token."""
+        self.semaphore.acquire()
+        self.wait_for_token()
+
+    def release(self):
+        self.semaphore.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                          max_retries=CONNECTION_RETRIES)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = _create_session()
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(url: str) -> HostLimiter:
+    """Return the shared limiter for the URL's host."""
+    host = urlparse(url).netloc.lower()
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(*HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+            _limiters[host] = limiter
+        return limiter
+
+
+def _retry_delay(response: requests.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX_SECONDS, float(retry_after))
+        except ValueError:
+            pass
+    delay = BACKOFF_BASE_SECONDS * (2 ** attempt)
+    return min(BACKOFF_MAX_SECONDS, delay + random.uniform(0, delay / 2))
+
+
+def _release_on_close(response: requests.Response, limiter: HostLimiter):
+    """Hand the limiter slot back only when the streamed response is closed."""
+    close = response.close
+    released = threading.Lock()
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if released.acquire(blocking=False):
+                limiter.release()
+
+    response.close = close_and_release
+
+
+def pdok_get(url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+             timeout: float = 30, max_retries: int = MAX_RETRIES, stream: bool = False) -> requests.Response:
+    """
+    GET a PDOK URL through the host limiter.
+
+    Throttled responses (429/503) are retried up to max_retries times; the
+    last response is returned as-is so callers keep their own status handling.
+    With stream=True the body is left unread for iter_features(), and the
+    host slot stays taken until the response is closed, so the download
+    counts against the concurrency cap too; callers that do not hand the
+    response to iter_features() must close it themselves.
+    """
+    limiter = get_host_limiter(url)
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            response = _session.get(url, params=params, headers=headers, timeout=timeout, stream=stream)
+        except Exception:
+            limiter.release()
+            raise
+        if stream:
+            _release_on_close(response, limiter)
+        else:
+            limiter.release()
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+            return response
+        response.close()
+        delay = _retry_delay(response, attempt)
+        log.warning("⏳ %s returned %s, retrying in %.1fs", urlparse(url).netloc, response.status_code, delay)
+        time.sleep(delay)
+    return response
+
+
+_last_warmup = 0.0
+_warmup_lock = threading.Lock()
+
+
+def _warm_connection(url: str):
+    try:
+        with get_host_limiter(url):
+            _session.head(url, timeout=WARMUP_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        log.warning("⚠️ PDOK warm-up for %s failed: %s", urlparse(url).netloc, e)
+
+
+def warm_connections(urls=WARMUP_URLS):
+    """
+    Open pooled connections to the PDOK hosts in background threads.
+
+    Called when a query starts, so the TCP/TLS handshakes overlap with the
+    agent's first LLM round-trip instead of delaying the first tool call.
+    Does nothing if the hosts were warmed within WARMUP_INTERVAL_SECONDS.
+    """
+    global _last_warmup
+    with _warmup_lock:
+        now = time.monotonic()
+        if now - _last_warmup < WARMUP_INTERVAL_SECONDS:
+            return
+        _last_warmup = now
+    for url in urls:
+        threading.Thread(target=_warm_connection, args=(url,), name="pdok-warmup", daemon=True).start()
+
+
+def response_json(response: requests.Response):
+    """Decode a JSON response body, with orjson when available."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def iter_features(response: requests.Response, limit: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Yield the features of a streamed GeoJSON response as they are parsed.
+
+    Requires ijson and a response fetched with stream=True. Reading stops
+    after limit features and the connection is released either way.
+    """
+    response.raw.decode_content = True
+    try:
+        for feature in islice(ijson.items(response.raw, "features.item", use_float=True), limit):
+            yield _intern_keys(feature)
+    finally:
+        response.close()
+
+
+def _intern_keys(feature: Dict) -> Dict:
+    """
+    Share one key string per attribute name across features. ijson, unlike
+    json.loads and orjson, allocates every key anew, so a few thousand
+    features would otherwise each carry their own copies of the same names.
+    """
+    for name in ("properties", "geometry"):
+        part = feature.get(name)
+        if isinstance(part, dict):
+            feature[name] = {sys.intern(k): v for k, v in part.items()}
+    return {sys.intern(k): v for k, v in feature.items()}
+
+
+def _json_loads(text):
+    return orjson.loads(text) if ORJSON_AVAILABLE else json.loads(text)
+
+
+def _plain(value):
+    """NumPy scalars and datetimes from pyogrio as JSON-friendly Python values."""
+    if value is None:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None  # NaN marks a null numeric field
+    if not isinstance(value, (str, int, float, bool)):
+        return str(value)
+    return value
+
+
+def decode_flatgeobuf(content: bytes) -> list:
+    """
+    Decode a FlatGeobuf response body into GeoJSON-style feature dicts.
+
+    Requires FLATGEOBUF_AVAILABLE. Geometries come back from GEOS already
+    typed, so no per-coordinate string parsing is done.
+    """
+    meta, _, geometry, field_data = pyogrio.raw.read(content)
+    names = list(meta["fields"])
+    geometries = shapely.to_geojson(shapely.from_wkb(geometry)) if geometry is not None else None
+    count = len(geometries) if geometries is not None else (len(field_data[0]) if field_data else 0)
+    return [
+        {
+            "type": "Feature",
+            "properties": {name: _plain(column[i]) for name, column in zip(names, field_data)},
+            "geometry": _json_loads(geometries[i]) if geometries is not None and geometries[i] else None
+        }
+        for i in range(count)
+    ]
+
+
+__all__ = ["pdok_get", "response_json", "iter_features", "IJSON_AVAILABLE",
+           "decode_flatgeobuf", "FLATGEOBUF_AVAILABLE", "FLATGEOBUF_FORMATS", "warm_connections", "get_host_limiter", "HostLimiter", "HOST_LIMITS", "ORJSON_AVAILABLE"]
@@ -0,0 +1,156 @@
+# tools/result_cache.py - Small in-memory TTL/LRU caches for tool results
+
+"""
+Thread-safe caches used to skip repeated PDOK round-trips and agent runs.
+
+TTLCache keeps at most ``maxsize`` entries, evicting the least recently
+used one, and drops entries older than ``ttl`` seconds. ResultCache stores
+JSON-encoded results and decodes a fresh copy on every hit, so callers
+can mutate what they get back without corrupting the cache.
+
+When RESULT_CACHE_DIR is set, ResultCache also writes through to a SQLite
+file in that directory, so results survive restarts and are shared by
+worker processes. Bumping CACHE_VERSION invalidates every stored key.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+log = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# Part of every cache key; bump when cached result formats change
+CACHE_VERSION = 1
+
+
+class TTLCache:
+    """LRU cache whose entries expire after ttl seconds."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """SQLite-backed store of encoded results whose entries expire after ttl seconds."""
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return row[1]
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, expires, value) VALUES (?, ?, ?)",
+                (key, time.time() + self.ttl, value)
+            )
+            self._conn.commit()
+
+
+def open_disk_cache(name: str, ttl: float) -> Optional[DiskCache]:
+    """DiskCache at RESULT_CACHE_DIR/<name>.sqlite, or None when the directory is not configured."""
+    cache_dir = os.getenv("RESULT_CACHE_DIR")
+    if not cache_dir:
+        return None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        return DiskCache(os.path.join(cache_dir, f"{name}.sqlite"), ttl)
+    except (OSError, sqlite3.Error) as e:
+        log.warning("⚠️ Disk cache '%s' unavailable, using memory only: %s", name, e)
+        return None
+
+
+class ResultCache(TTLCache):
+    """TTLCache for JSON-compatible results; every hit is an independent copy."""
+
+    def __init__(self, maxsize: int = 128, ttl: float = 300, disk: Optional[DiskCache] = None):
+        super().__init__(maxsize, ttl)
+        self.disk = disk
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        raw = super().get(key)
+        if raw is None and self.disk is not None:
+            try:
+                raw = self.disk.get(key)
+            except sqlite3.Error as e:
+                log.warning("⚠️ Disk cache read failed: %s", e)
+            if raw is not None:
+                super().set(key, raw)
+        if raw is None:
+            return default
+        return orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+
+    def set(self, key: Hashable, value: Any):
+        try:
+            raw = orjson.dumps(value) if ORJSON_AVAILABLE else json.dumps(value).encode()
+        except (TypeError, ValueError):
+            return  # not JSON-compatible: simply not cached
+        super().set(key, raw)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, raw)
+            except sqlite3.Error as e:
+                log.warning("⚠️ Disk cache write failed: %s", e)
+
+
+def cache_key(*args) -> str:
+    """Stable, versioned key for call arguments, including dicts and lists."""
+    return json.dumps([CACHE_VERSION, *args], sort_keys=True, default=str)
+
+
+__all__ = ["TTLCache", "ResultCache", "DiskCache", "open_disk_cache", "cache_key", "CACHE_VERSION"]
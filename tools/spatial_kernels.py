@@ -0,0 +1,570 @@
+# tools/spatial_kernels.py - Numeric kernels for polygon geometry
+
+"""
+Numeric helpers shared by the spatial tools and the Flask app.
+
+A ring is converted to a 2-D float64 array once and handed to a single
+compiled loop (Numba when installed) instead of per-vertex Python checks;
+whole batches of rings go to GEOS through Shapely 2.x when it is available.
+Feature lists get a column-wise view so analytics reduce over arrays
+rather than walking dicts. Without NumPy the same maths runs on plain lists.
+"""
+
+import math
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """No-op stand-in for numba.njit when Numba is not installed."""
+        def decorator(func):
+            return func
+        return decorator
+
+try:
+    import shapely
+    # Only Shapely 2.x has the vectorized (array-at-a-time) API
+    SHAPELY_AVAILABLE = NUMPY_AVAILABLE and hasattr(shapely, "linearrings")
+except ImportError:
+    shapely = None
+    SHAPELY_AVAILABLE = False
+
+try:
+    import pyproj
+    # A Transformer compiles its PROJ pipeline when built and is safe to use
+    # from several threads, so every tool shares these two
+    WGS84_TO_RD = pyproj.Transformer.from_crs("EPSG:4326", "EPSG:28992", always_xy=True)
+    RD_TO_WGS84 = pyproj.Transformer.from_crs("EPSG:28992", "EPSG:4326", always_xy=True)
+    PYPROJ_AVAILABLE = True
+except ImportError:
+    WGS84_TO_RD = RD_TO_WGS84 = None
+    PYPROJ_AVAILABLE = False
+
+# A closed GeoJSON ring needs at least 4 positions (first == last)
+MIN_RING_VERTICES = 4
+
+# Decimal places kept on WGS84 output coordinates (~11 cm), ample for map display
+COORD_PRECISION = 6
+
+# Construction-year eras, matching the building legend categories
+ERA_BREAKS = (1900, 1950, 1980, 2000)
+ERA_LABELS = (
+    "Historic (< 1900)",
+    "Pre-war (1900-1949)",
+    "Post-war (1950-1979)",
+    "Late 20th C (1980-1999)",
+    "Modern (2000+)",
+)
+
+
+# Let LLVM reorder the sums and fuse multiply-adds so the loop vectorizes.
+# Full fastmath would also assume no NaN/inf and fold away the finite check.
+RING_FASTMATH = {"reassoc", "contract"}
+
+
+@njit(cache=True, fastmath=RING_FASTMATH)
+def _ring_centroid_area(arr):
+    """
+    Area-weighted (shoelace) centroid and area of an (n, 2) float64 ring, plus
+    whether every ordinate is finite; validation and measurement share the loop.
+    This is the centroid GEOS reports, so results do not depend on whether
+    Shapely is installed. A zero-area ring falls back to the mean of its
+    distinct vertices (the closing vertex is not counted twice).
+    Vertices are taken relative to the first one to keep the cross products
+    small. The loop has no early exit, so the sums are only meaningful when finite.
+    """
+    n = arr.shape[0]
+    x0 = arr[0, 0]
+    y0 = arr[0, 1]
+    sum_x = 0.0
+    sum_y = 0.0
+    moment_x = 0.0
+    moment_y = 0.0
+    twice_area = 0.0
+    finite = True
+    for i in range(n):
+        j = i + 1 if i + 1 < n else 0
+        x = arr[i, 0] - x0
+        y = arr[i, 1] - y0
+        xj = arr[j, 0] - x0
+        yj = arr[j, 1] - y0
+        finite &= math.isfinite(x) and math.isfinite(y)
+        cross = x * yj - xj * y
+        sum_x += x
+        sum_y += y
+        moment_x += (x + xj) * cross
+        moment_y += (y + yj) * cross
+        twice_area += cross
+    if twice_area != 0.0:
+        return (x0 + moment_x / (3.0 * twice_area), y0 + moment_y / (3.0 * twice_area),
+                0.5 * abs(twice_area), finite)
+    # Relative to the first vertex a closing vertex is (0, 0), so only the count changes
+    closed = n > 1 and arr[n - 1, 0] == x0 and arr[n - 1, 1] == y0
+    m = n - 1 if closed else n
+    return x0 + sum_x / m, y0 + sum_y / m, 0.0, finite
+
+
+def _ring_centroid_area_py(ring):
+    """Pure-Python fallback for _ring_centroid_area on a list of (x, y) tuples."""
+    n = len(ring)
+    x0, y0 = ring[0]
+    sum_x = sum_y = moment_x = moment_y = twice_area = 0.0
+    for i in range(n):
+        x1, y1 = ring[i]
+        if not (math.isfinite(x1) and math.isfinite(y1)):
+            return 0.0, 0.0, 0.0, False
+        x2, y2 = ring[i + 1 if i + 1 < n else 0]
+        x1, y1, x2, y2 = x1 - x0, y1 - y0, x2 - x0, y2 - y0
+        cross = x1 * y2 - x2 * y1
+        sum_x += x1
+        sum_y += y1
+        moment_x += (x1 + x2) * cross
+        moment_y += (y1 + y2) * cross
+        twice_area += cross
+    if twice_area != 0.0:
+        return (x0 + moment_x / (3.0 * twice_area), y0 + moment_y / (3.0 * twice_area),
+                0.5 * abs(twice_area), True)
+    m = n - 1 if n > 1 and ring[-1] == ring[0] else n
+    return x0 + sum_x / m, y0 + sum_y / m, 0.0, True
+
+
+def as_ring_array(coords):
+    """Convert a GeoJSON ring to an (n, 2) float64 array, or None if unusable."""
+    if not coords:
+        return None
+
+    if not NUMPY_AVAILABLE:
+        try:
+            ring = [(float(c[0]), float(c[1])) for c in coords if len(c) >= 2]
+        except (TypeError, ValueError):
+            return None
+        return ring or None
+
+    try:
+        arr = np.asarray(coords, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Ragged ring (mixed 2D/3D positions): keep the usable XY pairs
+        try:
+            arr = np.asarray([c[:2] for c in coords if len(c) >= 2], dtype=np.float64)
+        except (TypeError, ValueError):
+            return None
+
+    if arr.ndim != 2 or arr.shape[0] == 0 or arr.shape[1] < 2:
+        return None
+    return np.ascontiguousarray(arr[:, :2])
+
+
+def ring_centroid_area(coords) -> Optional[Tuple[float, float, float]]:
+    """
+    Validate a polygon ring and compute its centroid and area in one pass.
+
+    Returns (x, y, area) in the ring's own units, or None when the ring is
+    not a valid polygon ring (too few vertices or non-finite ordinates).
+    """
+    ring = as_ring_array(coords)
+    if ring is None or len(ring) < MIN_RING_VERTICES:
+        return None
+
+    if NUMPY_AVAILABLE:
+        x, y, area, finite = _ring_centroid_area(ring)
+    else:
+        x, y, area, finite = _ring_centroid_area_py(ring)
+    if not finite:
+        return None
+    return float(x), float(y), float(area)
+
+
+def rings_centroid_area(rings: List) -> List[Optional[Tuple[float, float, float]]]:
+    """
+    Batch version of ring_centroid_area.
+
+    With Shapely 2.x all rings are built and measured by GEOS in a few
+    vectorized calls; otherwise each ring goes through the compiled kernel.
+    Both give the area-weighted centroid.
+    """
+    if not SHAPELY_AVAILABLE:
+        return [ring_centroid_area(ring) for ring in rings]
+
+    results = [None] * len(rings)
+    arrays = [as_ring_array(ring) for ring in rings]
+    valid = [i for i, arr in enumerate(arrays) if arr is not None and len(arr) >= MIN_RING_VERTICES]
+    if not valid:
+        return results
+
+    try:
+        coords = np.concatenate([arrays[i] for i in valid])
+        # Rings with a NaN/inf ordinate are dropped with one reduction over all vertices
+        lengths = [len(arrays[i]) for i in valid]
+        finite = np.logical_and.reduceat(np.isfinite(coords).all(axis=1), np.cumsum([0] + lengths[:-1]))
+        if not finite.all():
+            valid = [i for i, ok in zip(valid, finite) if ok]
+            if not valid:
+                return results
+            coords = np.concatenate([arrays[i] for i in valid])
+        indices = np.repeat(np.arange(len(valid)), [len(arrays[i]) for i in valid])
+        polygons = shapely.polygons(shapely.linearrings(coords, indices=indices))
+        areas = shapely.area(polygons)
+        centroids = shapely.centroid(polygons)
+        xs, ys = shapely.get_x(centroids), shapely.get_y(centroids)
+    except Exception:
+        return [ring_centroid_area(ring) for ring in rings]
+
+    for k, i in enumerate(valid):
+        if np.isnan(xs[k]) or np.isnan(ys[k]):
+            # Degenerate (zero-area) ring: GEOS has no centroid, use the kernel's vertex mean
+            x, y, area, _ = _ring_centroid_area(arrays[i])
+            results[i] = (float(x), float(y), float(area))
+        else:
+            results[i] = (float(xs[k]), float(ys[k]), float(areas[k]))
+    return results
+
+
+def round_coordinates(coords, ndigits: int = COORD_PRECISION):
+    """Round every ordinate of a GeoJSON coordinates array (any nesting depth)."""
+    if coords and isinstance(coords[0], (list, tuple)):
+        return [round_coordinates(c, ndigits) for c in coords]
+    return [round(float(v), ndigits) for v in coords]
+
+
+def prepare_polygons(polygons: List, ndigits: int = COORD_PRECISION) -> List[Optional[List]]:
+    """
+    Validate and round a batch of Polygon coordinate arrays in one pass.
+
+    All rings of all polygons are stacked into one (n, 2) array; the finite
+    check and rounding run over that array and the result is split back per
+    ring. With Shapely 2.x the same buffer is handed to GEOS as one ragged
+    polygon array, and invalid (e.g. self-intersecting) polygons are repaired
+    with make_valid. Returns, per polygon, the rounded rings (XY only) or None
+    when a ring has non-finite values or the exterior ring has too few
+    vertices.
+    """
+    results = [None] * len(polygons)
+    owners, rings = [], []
+    for p, polygon in enumerate(polygons):
+        arrays = [as_ring_array(ring) for ring in polygon or []]
+        if not arrays or any(a is None for a in arrays) or len(arrays[0]) < MIN_RING_VERTICES:
+            continue
+        owners.append((p, len(arrays)))
+        rings.extend(arrays)
+
+    if not rings:
+        return results
+
+    if not NUMPY_AVAILABLE:
+        ring_iter = iter(rings)
+        for p, ring_count in owners:
+            polygon_rings = [next(ring_iter) for _ in range(ring_count)]
+            if all(math.isfinite(v) for ring in polygon_rings for xy in ring for v in xy):
+                results[p] = [[[round(x, ndigits), round(y, ndigits)] for x, y in ring] for ring in polygon_rings]
+        return results
+
+    lengths = np.fromiter((len(r) for r in rings), dtype=np.int64, count=len(rings))
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    coords = np.concatenate(rings)
+    finite_rings = np.logical_and.reduceat(np.isfinite(coords).all(axis=1), offsets)
+    rounded = np.split(np.round(coords, ndigits), offsets[1:])
+
+    r = 0
+    for p, ring_count in owners:
+        if finite_rings[r:r + ring_count].all():
+            results[p] = [ring.tolist() for ring in rounded[r:r + ring_count]]
+        r += ring_count
+
+    if SHAPELY_AVAILABLE:
+        _repair_invalid_polygons(results, owners, np.concatenate(rounded), lengths, ndigits)
+    return results
+
+
+def _repair_invalid_polygons(results: List, owners: List, coords, lengths, ndigits: int):
+    """Check all polygons with one is_valid call and make_valid the failures in place."""
+    try:
+        ring_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        polygon_offsets = np.concatenate(([0], np.cumsum([ring_count for _, ring_count in owners])))
+        geoms = shapely.from_ragged_array(shapely.GeometryType.POLYGON, coords, (ring_offsets, polygon_offsets))
+        invalid = np.flatnonzero(~shapely.is_valid(geoms))
+        if not invalid.size:
+            return
+        repaired = shapely.make_valid(geoms[invalid])
+    except Exception:
+        return  # e.g. unclosed rings: keep the rounded input as-is
+
+    repaired_rings = _largest_polygon_rings(repaired, ndigits)
+    for k, rings in zip(invalid, repaired_rings):
+        p = owners[k][0]
+        if results[p] is not None:
+            results[p] = rings
+
+
+def _largest_polygon_rings(geoms, ndigits: int) -> List[Optional[List]]:
+    """
+    Rings of the largest polygon in each make_valid result, or None where a
+    result has no polygon. Parts, areas and coordinates are taken for the
+    whole batch at once rather than per repaired geometry.
+    """
+    rings_per_geom = [None] * len(geoms)
+    # Two get_parts passes: collections, then the multipolygons inside them
+    parts, owner = shapely.get_parts(geoms, return_index=True)
+    parts, sub_owner = shapely.get_parts(parts, return_index=True)
+    owner = owner[sub_owner]
+    keep = (shapely.get_type_id(parts) == shapely.GeometryType.POLYGON) & ~shapely.is_empty(parts)
+    if not keep.any():
+        return rings_per_geom
+    parts, owner = parts[keep], owner[keep]
+
+    # Largest part per geometry: order by owner, then by descending area
+    order = np.lexsort((-shapely.area(parts), owner))
+    first = order[np.unique(owner[order], return_index=True)[1]]
+    _, coords, (ring_offsets, polygon_offsets) = shapely.to_ragged_array(parts[first])
+    coords = np.round(coords, ndigits)
+    for k, g in enumerate(owner[first]):
+        rings_per_geom[g] = [
+            coords[ring_offsets[r]:ring_offsets[r + 1]].tolist()
+            for r in range(polygon_offsets[k], polygon_offsets[k + 1])
+        ]
+    return rings_per_geom
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@njit(cache=True)
+def _location_kernel(lat, lon, lat_min, lat_max, lon_min, lon_max, lat0, lon0, with_center):
+    """
+    Bounds flags and haversine distances (radians in, km out) in one fused
+    loop, without the temporaries the array expression allocates per step.
+    """
+    n = lat.shape[0]
+    inside = np.empty(n, np.bool_)
+    distances = np.empty(n if with_center else 0, np.float64)
+    cos_lat0 = math.cos(lat0)
+    for i in range(n):
+        la = lat[i]
+        lo = lon[i]
+        inside[i] = lat_min <= la <= lat_max and lon_min <= lo <= lon_max
+        if with_center:
+            la_r = math.radians(la)
+            a = (math.sin((la_r - lat0) / 2) ** 2
+                 + cos_lat0 * math.cos(la_r) * math.sin((math.radians(lo) - lon0) / 2) ** 2)
+            distances[i] = 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return inside, distances
+
+
+def location_checks(lats: List[float], lons: List[float], bounds: Tuple[float, float, float, float],
+                    center: Optional[Tuple[float, float]] = None) -> Tuple[List[bool], Optional[List[float]]]:
+    """
+    Bounds test and great-circle distance for many points at once.
+
+    bounds is (lat_min, lat_max, lon_min, lon_max) and center is (lat, lon).
+    Returns (inside_bounds, distances_km); distances is None without a center.
+    """
+    lat_min, lat_max, lon_min, lon_max = bounds
+
+    if not NUMPY_AVAILABLE:
+        inside = [lat_min <= la <= lat_max and lon_min <= lo <= lon_max for la, lo in zip(lats, lons)]
+        if center is None:
+            return inside, None
+        lat0, lon0 = math.radians(center[0]), math.radians(center[1])
+        distances = []
+        for la, lo in zip(lats, lons):
+            la, lo = math.radians(la), math.radians(lo)
+            a = math.sin((la - lat0) / 2) ** 2 + math.cos(lat0) * math.cos(la) * math.sin((lo - lon0) / 2) ** 2
+            distances.append(2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+        return inside, distances
+
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    if NUMBA_AVAILABLE:
+        lat0, lon0 = (math.radians(center[0]), math.radians(center[1])) if center is not None else (0.0, 0.0)
+        inside, distances = _location_kernel(lat, lon, lat_min, lat_max, lon_min, lon_max,
+                                             lat0, lon0, center is not None)
+        return inside.tolist(), (distances.tolist() if center is not None else None)
+    inside = (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+    if center is None:
+        return inside.tolist(), None
+    lat0, lon0 = np.radians(center[0]), np.radians(center[1])
+    lat_r, lon_r = np.radians(lat), np.radians(lon)
+    a = np.sin((lat_r - lat0) / 2) ** 2 + np.cos(lat0) * np.cos(lat_r) * np.sin((lon_r - lon0) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return inside.tolist(), distances.tolist()
+
+
+def era_counts(years) -> List[int]:
+    """Number of construction years in each ERA_LABELS bucket; NaN and zero years are skipped."""
+    if not NUMPY_AVAILABLE:
+        counts = [0] * len(ERA_LABELS)
+        for y in years:
+            if y > 0:
+                counts[sum(1 for b in ERA_BREAKS if y >= b)] += 1
+        return counts
+    years = np.asarray(years, dtype=np.float64)
+    years = years[years > 0]
+    return np.bincount(np.digitize(years, ERA_BREAKS), minlength=len(ERA_LABELS)).tolist()
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def build_feature_columns(features: List[Dict]) -> Dict[str, object]:
+    """
+    Build a column-wise (SoA) view of a feature list for analytics.
+
+    Columns: lat, lon, year, area (NaN when unknown) and geom_type, an
+    integer code indexing the geom_type_names list. The feature dicts stay
+    the source for map rendering; this view is built once when features are
+    stored so analytics never walks the dicts again.
+    """
+    lat, lon, year, area, geom_type = [], [], [], [], []
+    type_codes = {}
+    for feature in features:
+        props = feature.get('properties') or {}
+        geometry = feature.get('geometry') or {}
+        lat.append(_to_float(feature.get('lat')))
+        lon.append(_to_float(feature.get('lon')))
+        year.append(_to_float(props.get('bouwjaar')))
+        area.append(_to_float(feature.get('area_m2', props.get('kadastraleGrootteWaarde', props.get('oppervlakte')))))
+        geom_type.append(type_codes.setdefault(geometry.get('type') or "Unknown", len(type_codes)))
+
+    geom_type_names = list(type_codes)
+    if not NUMPY_AVAILABLE:
+        return {"lat": lat, "lon": lon, "year": year, "area": area,
+                "geom_type": geom_type, "geom_type_names": geom_type_names}
+    return {
+        "lat": np.asarray(lat, dtype=np.float64),
+        "lon": np.asarray(lon, dtype=np.float64),
+        "year": np.asarray(year, dtype=np.float64),
+        "area": np.asarray(area, dtype=np.float64),
+        "geom_type": np.asarray(geom_type, dtype=np.intp),
+        "geom_type_names": geom_type_names,
+    }
+
+
+def mean_location(columns: Dict[str, object]) -> Optional[Tuple[float, float]]:
+    """Mean (lat, lon) of the features that have a non-zero position, or None."""
+    if not NUMPY_AVAILABLE:
+        located = [(la, lo) for la, lo in zip(columns["lat"], columns["lon"]) if la and lo and la == la and lo == lo]
+        if not located:
+            return None
+        return sum(p[0] for p in located) / len(located), sum(p[1] for p in located) / len(located)
+    lat, lon = columns["lat"], columns["lon"]
+    located = ~(np.isnan(lat) | np.isnan(lon)) & (lat != 0) & (lon != 0)
+    if not located.any():
+        return None
+    return float(lat[located].mean()), float(lon[located].mean())
+
+
+def summarize_feature_columns(columns: Dict[str, object]) -> Dict:
+    """Geometry-type counts, construction-year, area and extent statistics."""
+    if NUMPY_AVAILABLE:
+        return _summarize_columns_np(columns)
+    return _summarize_columns_py(columns)
+
+
+def _summarize_columns_np(columns: Dict[str, object]) -> Dict:
+    names = columns["geom_type_names"]
+    counts = np.bincount(columns["geom_type"], minlength=len(names))
+    summary = {"geometry_types": dict(zip(names, counts.tolist()))}
+
+    # Zero (and NaN) years are unknown, as in era_counts and the legend
+    years = columns["year"][columns["year"] > 0]
+    if years.size:
+        eras = era_counts(years)
+        summary["construction_years"] = {
+            "count": int(years.size),
+            "oldest": int(years.min()),
+            "newest": int(years.max()),
+            "average": int(years.mean()),
+            "eras": {label: n for label, n in zip(ERA_LABELS, eras) if n},
+        }
+
+    areas = columns["area"][~np.isnan(columns["area"])]
+    if areas.size:
+        summary["area_m2"] = {
+            "count": int(areas.size),
+            "total": round(float(areas.sum()), 1),
+            "average": round(float(areas.mean()), 1),
+            "min": round(float(areas.min()), 1),
+            "max": round(float(areas.max()), 1),
+        }
+
+    located = ~(np.isnan(columns["lat"]) | np.isnan(columns["lon"]))
+    if located.any():
+        lats, lons = columns["lat"][located], columns["lon"][located]
+        summary["bounds"] = {
+            "min_lat": float(lats.min()), "max_lat": float(lats.max()),
+            "min_lon": float(lons.min()), "max_lon": float(lons.max()),
+        }
+    return summary
+
+
+def _summarize_columns_py(columns: Dict[str, object]) -> Dict:
+    names = columns["geom_type_names"]
+    counts = Counter(columns["geom_type"])
+    summary = {"geometry_types": {name: counts[code] for code, name in enumerate(names)}}
+
+    years = [y for y in columns["year"] if y > 0]
+    if years:
+        eras = era_counts(years)
+        summary["construction_years"] = {
+            "count": len(years),
+            "oldest": int(min(years)),
+            "newest": int(max(years)),
+            "average": int(sum(years) / len(years)),
+            "eras": {label: n for label, n in zip(ERA_LABELS, eras) if n},
+        }
+
+    areas = [a for a in columns["area"] if a == a]
+    if areas:
+        summary["area_m2"] = {
+            "count": len(areas),
+            "total": round(sum(areas), 1),
+            "average": round(sum(areas) / len(areas), 1),
+            "min": round(min(areas), 1),
+            "max": round(max(areas), 1),
+        }
+
+    located = [(la, lo) for la, lo in zip(columns["lat"], columns["lon"]) if la == la and lo == lo]
+    if located:
+        lats, lons = [p[0] for p in located], [p[1] for p in located]
+        summary["bounds"] = {
+            "min_lat": min(lats), "max_lat": max(lats),
+            "min_lon": min(lons), "max_lon": max(lons),
+        }
+    return summary
+
+
+__all__ = [
+    "WGS84_TO_RD",
+    "RD_TO_WGS84",
+    "PYPROJ_AVAILABLE",
+    "as_ring_array",
+    "ring_centroid_area",
+    "rings_centroid_area",
+    "round_coordinates",
+    "prepare_polygons",
+    "location_checks",
+    "era_counts",
+    "build_feature_columns",
+    "mean_location",
+    "summarize_feature_columns",
+    "COORD_PRECISION",
+    "ERA_LABELS",
+    "NUMPY_AVAILABLE",
+    "NUMBA_AVAILABLE",
+    "SHAPELY_AVAILABLE",
+]
@@ -0,0 +1,22 @@
+# tools/text_patterns.py - Compiled keyword patterns shared by the tools
+
+"""
+Keyword matching helpers.
+
+The tools classify queries and attribute names by checking whether any of
+a set of keywords occurs in a string. keyword_pattern() compiles such a
+set into one alternation, so each string is scanned once instead of once
+per keyword. Keywords match as substrings, longest first, so Dutch
+compounds ("kadasterpercelen") and derived words still count.
+"""
+
+import re
+from typing import Iterable
+
+
+def keyword_pattern(words: Iterable[str], flags: int = 0) -> re.Pattern:
+    """One compiled pattern that finds any of the words as a substring (longest first)."""
+    return re.compile('|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True)), flags)
+
+
+__all__ = ["keyword_pattern"]